@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from settings import env_float, env_int
+
+
+def normalize_question(question: str) -> str:
+    text = " ".join(question.lower().split())
+    return re.sub(r"[\s?.!]+$", "", text)
+
+
+@dataclass
+class _Entry:
+    answer: str
+    vector: Optional[np.ndarray]
+    created_at: float
+
+
+# Process-wide cache of generated answers. Exact hits are keyed by namespace
+# and normalized question text and skip every remote call; the semantic tier
+# reuses an answer when a new question's (normalized) query embedding is
+# within ``similarity`` cosine of a cached question in the same namespace,
+# skipping retrieval and generation. Entries expire after ``ttl_seconds`` and
+# the least recently used are evicted beyond ``max_entries``.
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        similarity: Optional[float] = None,
+    ):
+        self.max_entries = max(1, max_entries if max_entries is not None else env_int("ANSWER_CACHE_MAX_ENTRIES", 2048))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else env_float("ANSWER_CACHE_TTL_SECONDS", 3600.0)
+        self.similarity = similarity if similarity is not None else env_float("ANSWER_CACHE_SIMILARITY", 0.95)
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _live(self, key: Tuple[str, str], now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.created_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, namespace: str, question: str) -> Optional[str]:
+        key = (namespace, normalize_question(question))
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.answer
+
+    def get_similar(self, namespace: str, vector: np.ndarray) -> Optional[str]:
+        if not 0 < self.similarity <= 1:
+            return None
+        now = time.time()
+        with self._lock:
+            candidates: Dict[Tuple[str, str], np.ndarray] = {}
+            for key in [k for k in self._entries if k[0] == namespace]:
+                entry = self._live(key, now)
+                if entry is not None and entry.vector is not None and entry.vector.shape == vector.shape:
+                    candidates[key] = entry.vector
+            if not candidates:
+                self.misses += 1
+                return None
+            keys = list(candidates)
+            scores = np.stack([candidates[k] for k in keys]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return self._entries[keys[best]].answer
+
+    def put(self, namespace: str, question: str, answer: str, vector: Optional[np.ndarray] = None) -> None:
+        key = (namespace, normalize_question(question))
+        with self._lock:
+            self._entries[key] = _Entry(answer=answer, vector=vector, created_at=time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str) -> None:
+        # Multi-document answers are keyed by comma-joined namespaces.
+        with self._lock:
+            for key in [k for k in self._entries if namespace in k[0].split(",")]:
+                del self._entries[key]
@@ -1,17 +1,18 @@
-import os
 import hashlib
 import time
 import re
 from secrets import randbelow
 import streamlit as st
-from dotenv import load_dotenv
-from pinecone import Pinecone
 
-from rag_logic import process_document, get_answer
+from ingest_jobs import IngestJobManager, STATE_DONE, STATE_FAILED, STATE_QUEUED
+import tracing
+from rag_logic import indexed_content_hash, process_document, stream_answer
+from resources import get_resource, load_environment, vector_index
+from settings import env_flag, env_int
 
 
-
-load_dotenv()
+load_environment()
+tracing.setup()
 
 # Enhanced CSS for improved UI/UX
 st.markdown("""
@@ -372,10 +373,18 @@ st.markdown("""
 
 
 # Session state
-if "doc_id" not in st.session_state:
-    st.session_state.doc_id = None
+# Processed documents (namespace -> display name) and the ones chat queries.
+if "documents" not in st.session_state:
+    st.session_state.documents = {}
+if "active_documents" not in st.session_state:
+    st.session_state.active_documents = []
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "ingest_job" not in st.session_state:
+    st.session_state.ingest_job = None
+    st.session_state.ingest_label = None
+if "ingest_notice" not in st.session_state:
+    st.session_state.ingest_notice = None
 if "captcha" not in st.session_state:
     st.session_state.captcha = {
         "a": None,
@@ -466,23 +475,43 @@ def _contains_malicious_pattern(text: str) -> bool:
 
 
 def _get_pinecone_index():
-    api_key = os.getenv("PINECONE_API_KEY")
-    index_name = os.getenv("PINECONE_INDEX")
-    if not api_key or not index_name:
-        st.error("PINECONE_API_KEY and PINECONE_INDEX must be set in environment.")
-        st.stop()
-    pc = Pinecone(api_key=api_key)
+    # The index handle is built once per process and shared by every session;
+    # see resources.vector_index.
     try:
-        index = pc.Index(index_name)
+        return vector_index()
     except Exception as e:
-        st.error(f"Failed to access Pinecone index '{index_name}': {e}")
+        st.error(f"Failed to access vector index: {e}")
         st.stop()
-    return index
+
+
+def _get_ingest_jobs() -> IngestJobManager:
+    # One job pool per process, shared by every session.
+    max_concurrent = env_int("INGEST_MAX_CONCURRENT", 2)
+    return get_resource(
+        "ingest_jobs", max_concurrent, lambda: IngestJobManager(process_document, max_concurrent)
+    )
 
 
 index = _get_pinecone_index()
 
 
+def _document_namespace(name: str):
+    # A named document keeps one namespace across revisions; unnamed uploads
+    # fall back to the file hash.
+    slug = re.sub(r"[^a-z0-9]+", "-", (name or "").strip().lower()).strip("-")
+    return f"doc-{slug}" if slug else None
+
+
+def _replaces_other_document(namespace: str, file_bytes: bytes) -> bool:
+    # Names are shared by every session, so a different file under a name
+    # this session did not index itself would replace someone else's
+    # document (and what their sessions answer from).
+    if namespace in st.session_state.documents:
+        return False
+    existing = indexed_content_hash(namespace)
+    return existing is not None and existing != hashlib.md5(file_bytes).hexdigest()
+
+
 # Enhanced sidebar controls
 # --- Side bar controls ---
 # --- Side bar controls ---
@@ -504,10 +533,35 @@ with st.sidebar:
         help=f"Drag and drop your PDF file here or click to browse (Max {MAX_FILE_SIZE_MB}MB)"
     )
     st.caption(f"Limit {MAX_FILE_SIZE_MB}MB per file • PDF")
+    document_name = st.text_input(
+        "🏷️ Document name (optional)",
+        help="Give revisions of the same document the same name to re-index only the pages that changed."
+    )
+    named = _document_namespace(document_name)
+    if named and named not in st.session_state.documents and indexed_content_hash(named) is not None:
+        st.checkbox(
+            "♻️ Replace the existing document with this name",
+            key="confirm_replace",
+            help="A document with this name is already indexed. Replacing it changes what every session using it answers from."
+        )
     process_clicked = st.button("🚀 Process Document", type="primary")
 
     st.info(f"📄 Only PDF files are supported. Maximum file size: {MAX_FILE_SIZE_MB}MB")
 
+    # Newly processed documents join the selection here, before the widget
+    # that owns the key is created.
+    finished = st.session_state.pop("finished_document", None)
+    if finished and finished not in st.session_state.active_documents:
+        st.session_state.active_documents = st.session_state.active_documents + [finished]
+    if st.session_state.documents:
+        st.multiselect(
+            "📚 Documents to query",
+            options=list(st.session_state.documents),
+            format_func=lambda namespace: st.session_state.documents.get(namespace, namespace),
+            key="active_documents",
+            help="Questions are answered across every selected document."
+        )
+
     st.markdown("---")
 
     _show_captcha_sidebar()
@@ -530,19 +584,64 @@ if process_clicked:
             st.stop()
         
         file_bytes = uploaded_file.getvalue()
-        doc_id = hashlib.md5(file_bytes).hexdigest()
+        doc_id = _document_namespace(document_name) or hashlib.md5(file_bytes).hexdigest()
+        if _document_namespace(document_name) and _replaces_other_document(doc_id, file_bytes) \
+                and not st.session_state.get("confirm_replace"):
+            st.warning("⚠️ A different document with this name already exists. Confirm replacing it in the sidebar, or choose another name.")
+            st.stop()
+
+        # Ingestion runs on the background job pool; this session only polls it.
+        try:
+            st.session_state.ingest_job = _get_ingest_jobs().submit(index, file_bytes, doc_id)
+        except ValueError as e:
+            st.warning(f"⏳ {e}")
+            st.stop()
+        st.session_state.ingest_label = document_name.strip() or uploaded_file.name
+        st.session_state.ingest_notice = None
+
+
+def _job_label(job) -> str:
+    if job.state == STATE_QUEUED:
+        return "⏳ Queued — waiting for a free processing slot..."
+    pages = f"{job.pages_extracted}/{job.page_count}" if job.page_count else f"{job.pages_extracted}"
+    return (
+        f"🔄 {job.stage.capitalize()} — {pages} pages extracted, "
+        f"{job.chunks_embedded} chunks embedded, {job.vectors_upserted} vectors upserted"
+    )
+
+
+def _show_ingest_progress():
+    job_id = st.session_state.ingest_job
+    job = _get_ingest_jobs().status(job_id) if job_id else None
+    if job is None:
+        st.session_state.ingest_job = None
+        return
+    if job.state == STATE_DONE:
+        st.session_state.documents[job.namespace] = st.session_state.ingest_label or job.namespace
+        st.session_state.finished_document = job.namespace
+        st.session_state.ingest_job = None
+        st.session_state.ingest_notice = ("success", "✅ Document processed and indexed successfully!")
+        st.rerun()
+    elif job.state == STATE_FAILED:
+        st.session_state.ingest_job = None
+        st.session_state.ingest_notice = ("error", f"❌ Processing failed: {job.error}")
+        st.rerun()
+    else:
+        st.progress(job.fraction, text=_job_label(job))
+
+
+# Only the progress bar re-renders while a job runs, once per second.
+if hasattr(st, "fragment"):
+    _show_ingest_progress = st.fragment(run_every=1.0)(_show_ingest_progress)
 
-        # Enhanced loading with custom styling
-        with st.spinner("🔄 Processing document and preparing knowledge base..."):
-            try:
-                ok = process_document(index, file_bytes, doc_id)
-            except Exception as e:
-                st.error(f"❌ Processing failed: {e}")
-                ok = False
+if st.session_state.ingest_job:
+    _show_ingest_progress()
 
-        if ok:
-            st.session_state.doc_id = doc_id
-            st.success("✅ Document processed and indexed successfully!")
+notice = st.session_state.ingest_notice
+if notice:
+    level, message = notice
+    (st.success if level == "success" else st.error)(message)
+    st.session_state.ingest_notice = None
 
 
 # Enhanced chat interface with left alignment
@@ -574,8 +673,8 @@ else:
 # Enhanced chat input with better loading feedback
 prompt = st.chat_input(f"💭 Ask a question about your document (max {MAX_PROMPT_CHARS} chars)…")
 if prompt:
-    if not st.session_state.doc_id:
-        st.warning("📄 No active document. Please upload and process a document first.")
+    if not st.session_state.active_documents:
+        st.warning("📄 No active document. Please upload and process a document first, or select one in the sidebar.")
     else:
         if not _captcha_is_valid():
             st.warning("🔒 Please re-verify the CAPTCHA to continue chatting.")
@@ -589,12 +688,22 @@ if prompt:
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
-                # Enhanced loading with custom spinner
-                with st.spinner("🧠 Generating insights..."):
-                    try:
-                        answer = get_answer(index, prompt, st.session_state.doc_id)
-                    except Exception as e:
-                        answer = f"❌ Error: {e}"
+                # Render tokens as Gemini produces them; the full text is kept
+                # for the conversation history.
+                try:
+                    active = st.session_state.active_documents
+                    labels = {namespace: st.session_state.documents.get(namespace, namespace) for namespace in active}
+                    with tracing.collect() as spans:
+                        answer = st.write_stream(stream_answer(index, prompt, active, labels))
+                    answer = answer.strip() if isinstance(answer, str) else "".join(map(str, answer)).strip()
+                    if env_flag("OPERATOR_TIMINGS", False) and spans:
+                        with st.expander("⏱️ Timing breakdown"):
+                            st.table([
+                                {"stage": name, "ms": round(ms, 1), "details": ", ".join(f"{k}={v}" for k, v in attrs.items())}
+                                for name, ms, attrs in tracing.breakdown(spans)
+                            ])
+                except Exception as e:
+                    answer = f"❌ Error: {e}"
                     st.markdown(answer)
             st.session_state.messages.append(("assistant", answer))
 
@@ -0,0 +1,145 @@
+"""Answer a list of questions against one or more indexed documents.
+
+Questions are embedded together in one batched request, retrieval for each
+question runs concurrently and generations go through a bounded pool.
+Results keep the input order. Run from the repository root:
+
+    python batch_qa.py --namespace <doc_id> --questions questions.txt --output answers.json
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from rag_logic import Namespaces, embed_questions, generate_answer, prepare_answer
+from resources import load_environment, vector_index
+from settings import env_int
+
+
+@dataclass
+class BatchAnswer:
+    question: str
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    retrieval_seconds: float = 0.0
+    generation_seconds: float = 0.0
+
+    @property
+    def seconds(self) -> float:
+        return self.retrieval_seconds + self.generation_seconds
+
+
+def answer_questions(
+    index: Any,
+    questions: Sequence[str],
+    namespace: Namespaces,
+    labels: Optional[Dict[str, str]] = None,
+    query_workers: Optional[int] = None,
+    generate_workers: Optional[int] = None,
+) -> List[BatchAnswer]:
+    # A failure is recorded on its own question; the rest of the batch still
+    # completes.
+    if not index:
+        raise ValueError("Index cannot be None")
+    if query_workers is None:
+        query_workers = env_int("BATCH_QUERY_WORKERS", 8)
+    if generate_workers is None:
+        generate_workers = env_int("BATCH_GENERATE_WORKERS", 4)
+    results = [BatchAnswer(question=question) for question in questions]
+
+    # Every question is embedded in one request (split only beyond the API's
+    # 100-item limit); cached embeddings are not re-requested.
+    valid = [i for i, question in enumerate(questions) if question and question.strip()]
+    start = time.perf_counter()
+    try:
+        matrix = embed_questions([questions[i] for i in valid])
+    except Exception as exc:
+        for i in valid:
+            results[i].error = f"Embedding failed: {exc}"
+        return results
+    embeddings = dict(zip(valid, matrix))
+    embed_share = (time.perf_counter() - start) / max(1, len(valid))
+
+    def generate(i: int, prompt: str, search_embedding: Any) -> None:
+        start = time.perf_counter()
+        try:
+            answer = generate_answer(prompt, namespace, questions[i], search_embedding)
+            results[i].answer = answer or "No answer generated."
+        except Exception as exc:
+            results[i].error = str(exc) or type(exc).__name__
+        finally:
+            results[i].generation_seconds = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max(1, generate_workers), thread_name_prefix="batch-generate") as generate_pool:
+        def prepare(i: int) -> Optional["Future[None]"]:
+            start = time.perf_counter()
+            try:
+                answer, prompt, search_embedding = prepare_answer(
+                    index, questions[i], namespace, labels, embeddings.get(i)
+                )
+            except Exception as exc:
+                results[i].error = str(exc) or type(exc).__name__
+                return None
+            finally:
+                results[i].retrieval_seconds = embed_share + time.perf_counter() - start
+            if answer is not None:
+                results[i].answer = answer
+                return None
+            # Generation starts as soon as this question's context is ready.
+            return generate_pool.submit(generate, i, prompt, search_embedding)
+
+        with ThreadPoolExecutor(max(1, query_workers), thread_name_prefix="batch-query") as query_pool:
+            pending = [future.result() for future in [query_pool.submit(prepare, i) for i in range(len(questions))]]
+        for future in pending:
+            if future is not None:
+                future.result()
+    return results
+
+
+def _read_questions(path: str) -> List[str]:
+    # A JSON list of strings, or one question per line.
+    with open(path, "r", encoding="utf-8") as fh:
+        content = fh.read()
+    if path.endswith(".json"):
+        return [str(question) for question in json.loads(content)]
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--namespace", action="append", required=True, help="Document namespace; repeat for several")
+    parser.add_argument("--questions", required=True, help="Text file with one question per line, or a JSON list")
+    parser.add_argument("--output", help="Write results as JSON here instead of stdout")
+    parser.add_argument("--query-workers", type=int)
+    parser.add_argument("--generate-workers", type=int)
+    args = parser.parse_args()
+
+    load_environment()
+    questions = _read_questions(args.questions)
+    start = time.perf_counter()
+    results = answer_questions(
+        vector_index(), questions, args.namespace,
+        query_workers=args.query_workers, generate_workers=args.generate_workers,
+    )
+    elapsed = time.perf_counter() - start
+
+    payload = json.dumps([{**asdict(result), "seconds": result.seconds} for result in results], indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(payload)
+    else:
+        print(payload)
+    failed = sum(1 for result in results if result.error)
+    print(
+        f"{len(results)} questions in {elapsed:.1f}s ({len(results) / elapsed if elapsed else 0:.1f}/s), {failed} failed",
+        file=sys.stderr,
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
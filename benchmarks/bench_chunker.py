@@ -0,0 +1,84 @@
+"""Chunker throughput on multi-megabyte text.
+
+Compares the offset-based ``rag_logic._chunk_text`` with the sentence-list
+chunker it replaced. Run from the repository root:
+
+    python -m benchmarks.bench_chunker --sizes 1 4 16
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from rag_logic import _chunk_text
+
+WORDS = (
+    "the policy section report revenue growth climate data engine insight "
+    "analysis quarterly figure table appendix customer contract term notice"
+).split()
+
+
+def legacy_chunk_text(text: str, max_chunk_size: int = 1500, overlap: int = 200) -> List[str]:
+    # The chunker as it was before the offset-based rewrite.
+    if not text or not text.strip():
+        return []
+    sentences = text.replace("!", ".").replace("?", ".").split(".")
+    sentences = [s.strip() + "." for s in sentences if s.strip()]
+
+    chunks: List[str] = []
+    current = ""
+    for sentence in sentences:
+        if len(current) + len(sentence) > max_chunk_size:
+            if current:
+                chunks.append(current.strip())
+                words = current.split()
+                overlap_text = " ".join(words[-overlap // 10:]) if len(words) > overlap // 10 else ""
+                current = (overlap_text + " " + sentence).strip() if overlap_text else sentence
+            else:
+                chunks.append(sentence[:max_chunk_size])
+                current = sentence[max_chunk_size:]
+        else:
+            current = (current + " " + sentence).strip() if current else sentence
+    if current.strip():
+        chunks.append(current.strip())
+    return [c for c in chunks if len(c.strip()) > 50]
+
+
+def synthetic_text(size_bytes: int, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    while total < size_bytes:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 40)))
+        sentence = sentence.capitalize() + rng.choice(".....!?")
+        parts.append(sentence)
+        total += len(sentence) + 1
+    return " ".join(parts)
+
+
+def measure(fn: Callable[[str], List[str]], text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="Text sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'chunker':>8} {'seconds':>9} {'MB/s':>8} {'chunks':>8}")
+    for size_mb in args.sizes:
+        text = synthetic_text(int(size_mb * 1024 * 1024))
+        for name, fn in (("legacy", legacy_chunk_text), ("offset", _chunk_text)):
+            seconds = measure(fn, text, args.repeat)
+            chunks = len(fn(text))
+            print(f"{size_mb:>6.1f}MB {name:>8} {seconds:>9.3f} {size_mb / seconds:>8.1f} {chunks:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Offline benchmark of the ingest and query pipeline.
+
+Gemini and the vector index are replaced by the deterministic fakes in
+``benchmarks.fakes`` with injectable latency, and documents are synthetic
+PDFs. Each stage is timed (best of ``--repeat``) and then re-run once under
+tracemalloc for its peak Python allocation. The ``query`` stage asks
+plain-language questions, which embed the question and search the index;
+``query_exact`` asks for section numbers, which the lexical index answers
+without either. Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --pages 1 10 100 1000 --save results.json
+    python -m benchmarks.bench_pipeline --baseline benchmarks/baseline.json
+
+Results are compared with the baseline when one exists; stages slower or
+heavier than ``--tolerance`` exit non-zero. ``--update-baseline`` stores the
+current run as the new baseline. Memory used by PDF extraction worker
+processes is not included in the peaks.
+
+Every run also ingests each document with a 1 MB buffer budget, and pushes
+stage-sized items through the pipeline with a budget only two items fit.
+Either one stalling for ``--stall-seconds`` fails the run; a stall means the
+stages deadlocked waiting for each other's buffer space.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _configure_environment(args: argparse.Namespace) -> None:
+    # Must run before rag_logic builds its local stores.
+    os.environ["INSIGHTENGINE_DATA_DIR"] = tempfile.mkdtemp(prefix="insightengine-bench-")
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    if not args.with_caches:
+        os.environ["EMBEDDING_CACHE"] = "0"
+        os.environ["ANSWER_CACHE"] = "0"
+
+
+def measure(fn: Callable[[], Any], repeat: int, memory: bool) -> Tuple[float, Optional[float], Any]:
+    # Returns (best seconds, peak MB or None, last result).
+    best = float("inf")
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+
+def finishes(fn: Callable[[], Any], seconds: float) -> bool:
+    # Runs ``fn`` on a daemon thread; False if it is still running after
+    # ``seconds`` (it is abandoned).
+    thread = threading.Thread(target=fn, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    return not thread.is_alive()
+
+
+def check_tight_pipeline(seconds: float) -> bool:
+    # Two stages, with items sized so the whole budget holds only two: every
+    # stage waits on buffer space, and the pipeline must still drain.
+    from ingest_pipeline import run_pipeline
+
+    size = 400 * 1024
+
+    def stage(items: Any) -> Any:
+        for item in items:
+            time.sleep(0.005)
+            yield item
+
+    received: List[int] = []
+    stages = [("first", stage, lambda _: size), ("second", stage, lambda _: size)]
+    done = finishes(lambda: run_pipeline(range(40), lambda _: size, stages, received.append, 1024 * 1024), seconds)
+    return done and len(received) == 40
+
+
+def run(args: argparse.Namespace, stalls: List[str]) -> List[Dict[str, Any]]:
+    import numpy as np
+
+    import rag_logic
+    from benchmarks.fakes import FakeGenai, FakeIndex, Latency, fake_embedding, installed
+    from benchmarks.synthetic_pdf import make_pdf, section_question, topic_question
+    from vector_upsert import upsert_with_retry
+
+    fake = FakeGenai(
+        embed_latency=Latency(args.embed_latency_ms, args.latency_sigma),
+        generate_latency=Latency(args.generate_latency_ms, args.latency_sigma),
+    )
+    index_latency = Latency(args.index_latency_ms, args.latency_sigma)
+    _, dimension = rag_logic._embedding_config()
+    results: List[Dict[str, Any]] = []
+
+    def record(pages: int, stage: str, seconds: float, peak: Optional[float], items: int, unit: str) -> None:
+        row = {
+            "pages": pages,
+            "stage": stage,
+            "seconds": round(seconds, 6),
+            "items": items,
+            "unit": unit,
+            "items_per_s": round(items / seconds, 2) if seconds else None,
+            "pages_per_s": round(pages / seconds, 2) if seconds and stage in ("extract", "ingest") else None,
+            "peak_mb": round(peak, 2) if peak is not None else None,
+        }
+        results.append(row)
+        rate = f"{row['items_per_s']:.1f} {unit}/s" if row["items_per_s"] else "-"
+        memory = f"{row['peak_mb']:.1f}MB" if row["peak_mb"] is not None else "-"
+        print(f"{pages:>6} {stage:>11} {seconds:>10.4f}s {rate:>20} {memory:>10}", flush=True)
+
+    print(f"{'pages':>6} {'stage':>11} {'time':>11} {'throughput':>20} {'peak':>10}")
+    if not check_tight_pipeline(args.stall_seconds):
+        stalls.append("pipeline with a two-item buffer budget stalled")
+    with installed(fake):
+        for pages in args.pages:
+            pdf = make_pdf(pages)
+            repeat = args.repeat if pages < 500 else 1
+
+            seconds, peak, text = measure(lambda: rag_logic._extract_text_from_pdf(pdf), repeat, args.memory)
+            record(pages, "extract", seconds, peak, pages, "pages")
+
+            seconds, peak, chunks = measure(lambda: rag_logic._chunk_text(text), repeat, args.memory)
+            record(pages, "chunk", seconds, peak, len(chunks), "chunks")
+
+            embeddings = np.stack([fake_embedding(chunk, dimension) for chunk in chunks])
+            seconds, peak, _ = measure(
+                lambda: [rag_logic._normalize_vector(row) for row in embeddings], repeat, args.memory
+            )
+            record(pages, "normalize", seconds, peak, len(chunks), "vectors")
+
+            vectors = [
+                {"id": rag_logic._vector_id(chunk), "values": values, "metadata": {"text": chunk, "chunk_index": i}}
+                for i, (chunk, values) in enumerate(zip(chunks, rag_logic._normalize_rows(embeddings)))
+            ]
+            seconds, peak, _ = measure(
+                lambda: upsert_with_retry(FakeIndex(index_latency), vectors, "bench-upsert"), repeat, args.memory
+            )
+            record(pages, "upsert", seconds, peak, len(vectors), "vectors")
+
+            # End to end: every run ingests into a fresh index and namespace.
+            runs = iter(range(10 ** 6))
+            index = FakeIndex(index_latency)
+            stats: Dict[str, int] = {}
+
+            def ingest() -> str:
+                namespace = f"bench-{pages}-{next(runs)}"
+                rag_logic.process_document(index, pdf, namespace, progress=lambda _, counters: stats.update(counters))
+                return namespace
+
+            seconds, peak, namespace = measure(ingest, repeat, args.memory)
+            record(pages, "ingest", seconds, peak, stats.get("chunks", 0), "chunks")
+
+            saved = os.environ.get("INGEST_MAX_BUFFER_MB")
+            os.environ["INGEST_MAX_BUFFER_MB"] = "1"
+            try:
+                start = time.perf_counter()
+                if not finishes(ingest, args.stall_seconds):
+                    stalls.append(f"{pages} pages: ingest with a 1 MB buffer stalled")
+                record(pages, "ingest_1mb", time.perf_counter() - start, None, stats.get("chunks", 0), "chunks")
+            finally:
+                if saved is None:
+                    del os.environ["INGEST_MAX_BUFFER_MB"]
+                else:
+                    os.environ["INGEST_MAX_BUFFER_MB"] = saved
+
+            # Questions in plain words go through embedding and index search;
+            # section-number questions take the lexical fast path and are
+            # reported as their own stage.
+            for stage, questions in (
+                ("query", [topic_question(i) for i in range(args.questions)]),
+                ("query_exact", [section_question(i, pages) for i in range(args.questions)]),
+            ):
+                latencies: List[float] = []
+                calls = (fake.embed_calls, index.calls.get("query", 0))
+
+                def ask() -> None:
+                    latencies.clear()
+                    for question in questions:
+                        start = time.perf_counter()
+                        rag_logic.get_answer(index, question, namespace)
+                        latencies.append(time.perf_counter() - start)
+
+                seconds, peak, _ = measure(ask, repeat, args.memory)
+                record(pages, stage, seconds, peak, len(questions), "questions")
+                runs_made = max(1, repeat) + (1 if args.memory else 0)
+                results[-1]["embed_calls"] = (fake.embed_calls - calls[0]) // runs_made
+                results[-1]["index_queries"] = (index.calls.get("query", 0) - calls[1]) // runs_made
+                if latencies:
+                    ordered = sorted(latencies)
+                    results[-1]["p50_s"] = round(ordered[len(ordered) // 2], 6)
+                    results[-1]["p95_s"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 6)
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float, min_seconds: float
+) -> List[str]:
+    # Stages faster than ``min_seconds`` are reported but never flagged;
+    # their timings are mostly noise.
+    previous = {(row["pages"], row["stage"]): row for row in baseline.get("results", [])}
+    regressions: List[str] = []
+    print(f"\n{'pages':>6} {'stage':>11} {'time vs baseline':>18} {'peak vs baseline':>18}")
+    for row in results:
+        before = previous.get((row["pages"], row["stage"]))
+        if not before:
+            continue
+        cells = []
+        for field in ("seconds", "peak_mb"):
+            now, then = row.get(field), before.get(field)
+            if not now or not then:
+                cells.append(f"{'-':>18}")
+                continue
+            ratio = now / then
+            noisy = field == "seconds" and now < min_seconds
+            flag = "!" if ratio > 1 + tolerance and not noisy else " "
+            cells.append(f"{ratio:>16.2f}x{flag}")
+            if flag == "!":
+                regressions.append(f"{row['pages']} pages {row['stage']} {field}: {then} -> {now} ({ratio:.2f}x)")
+        print(f"{row['pages']:>6} {row['stage']:>11} " + " ".join(cells))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage; 1 for 500+ pages")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--index-latency-ms", type=float, default=0.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Log-normal spread of injected latency")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Skip the tracemalloc runs")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the embedding and answer caches on")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging, e.g. 0.25")
+    parser.add_argument("--stall-seconds", type=float, default=120.0,
+                        help="Fail if a tight-buffer run takes longer than this")
+    parser.add_argument("--min-seconds", type=float, default=0.01, help="Never flag stages faster than this")
+    args = parser.parse_args()
+
+    _configure_environment(args)
+    stalls: List[str] = []
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("save", "baseline", "update_baseline")},
+        },
+        "results": run(args, stalls),
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    regressions: List[str] = []
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            regressions = compare(report["results"], json.load(fh), args.tolerance, args.min_seconds)
+    regressions = stalls + regressions
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
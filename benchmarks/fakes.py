@@ -0,0 +1,237 @@
+"""Offline stand-ins for Gemini and the vector index.
+
+Embeddings are deterministic per text, so repeated runs do the same work.
+Every remote call sleeps for a latency drawn from a log-normal distribution
+around a configured median, which is how API latency is usually shaped.
+"""
+import asyncio
+import contextlib
+import hashlib
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+class Latency:
+    def __init__(self, median_ms: float = 0.0, sigma: float = 0.0, seed: int = 7):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            factor = self._rng.lognormvariate(0.0, self.sigma) if self.sigma > 0 else 1.0
+        return self.median_ms * factor / 1000.0
+
+    def wait(self) -> None:
+        seconds = self.sample()
+        if seconds:
+            time.sleep(seconds)
+
+    async def wait_async(self) -> None:
+        seconds = self.sample()
+        if seconds:
+            await asyncio.sleep(seconds)
+
+
+def fake_embedding(text: str, dimension: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+
+class FakeGenai:
+    def __init__(self, embed_latency: Optional[Latency] = None, generate_latency: Optional[Latency] = None,
+                 stream_chunks: int = 8):
+        self.embed_latency = embed_latency or Latency()
+        self.generate_latency = generate_latency or Latency()
+        self.stream_chunks = stream_chunks
+        self.embed_calls = 0
+        self.embed_items = 0
+        self.generate_calls = 0
+        self._lock = threading.Lock()
+
+    def configure(self, **_: Any) -> None:
+        pass
+
+    def embed_content(self, model: str, content: Any, output_dimensionality: int = 768, **_: Any) -> Dict[str, Any]:
+        self._count_embed(content)
+        self.embed_latency.wait()
+        return self._embeddings(content, output_dimensionality)
+
+    async def embed_content_async(self, model: str, content: Any, output_dimensionality: int = 768,
+                                  **_: Any) -> Dict[str, Any]:
+        self._count_embed(content)
+        await self.embed_latency.wait_async()
+        return self._embeddings(content, output_dimensionality)
+
+    def _count_embed(self, content: Any) -> None:
+        with self._lock:
+            self.embed_calls += 1
+            self.embed_items += 1 if isinstance(content, str) else len(content)
+
+    def _embeddings(self, content: Any, dimension: int) -> Dict[str, Any]:
+        texts = [content] if isinstance(content, str) else list(content)
+        vectors = [fake_embedding(text, dimension).tolist() for text in texts]
+        return {"embedding": vectors[0] if isinstance(content, str) else vectors}
+
+    def GenerativeModel(self, model_name: str, **_: Any) -> "FakeModel":
+        return FakeModel(self)
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self, owner: FakeGenai):
+        self._owner = owner
+
+    def generate_content(self, prompt: str, stream: bool = False, **_: Any) -> Any:
+        with self._owner._lock:
+            self._owner.generate_calls += 1
+        answer = f"Answer drawn from {len(prompt)} prompt characters."
+        if not stream:
+            self._owner.generate_latency.wait()
+            return _Response(answer)
+        return self._stream(answer)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **_: Any) -> Any:
+        with self._owner._lock:
+            self._owner.generate_calls += 1
+        answer = f"Answer drawn from {len(prompt)} prompt characters."
+        if not stream:
+            await self._owner.generate_latency.wait_async()
+            return _Response(answer)
+        return self._stream_async(answer)
+
+    async def _stream_async(self, answer: str) -> AsyncIterator[_Response]:
+        total = self._owner.generate_latency.sample()
+        pieces = max(1, self._owner.stream_chunks)
+        await asyncio.sleep(total / 2)
+        step = max(1, len(answer) // pieces)
+        for i in range(0, len(answer), step):
+            await asyncio.sleep(total / 2 / pieces)
+            yield _Response(answer[i:i + step])
+
+    def _stream(self, answer: str) -> Iterator[_Response]:
+        # Time to first token is half the latency; the rest is spread over
+        # the streamed chunks.
+        total = self._owner.generate_latency.sample()
+        pieces = max(1, self._owner.stream_chunks)
+        time.sleep(total / 2)
+        step = max(1, len(answer) // pieces)
+        for i in range(0, len(answer), step):
+            time.sleep(total / 2 / pieces)
+            yield _Response(answer[i:i + step])
+
+
+class FakeIndex:
+    # In-memory index with Pinecone's call shapes and exact cosine search.
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self._namespaces: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    def _call(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        self.latency.wait()
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "", **_: Any) -> Dict[str, Any]:
+        self._call("upsert")
+        with self._lock:
+            store = self._namespaces.setdefault(namespace, {})
+            for vector in vectors:
+                store[vector["id"]] = {
+                    "id": vector["id"],
+                    "values": np.asarray(vector["values"], dtype=np.float32),
+                    "metadata": dict(vector.get("metadata") or {}),
+                }
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids: List[str], namespace: str = "", **_: Any) -> Dict[str, Any]:
+        self._call("fetch")
+        with self._lock:
+            store = self._namespaces.get(namespace, {})
+            return {"vectors": {i: store[i] for i in ids if i in store}, "namespace": namespace}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False,
+               **_: Any) -> Dict[str, Any]:
+        self._call("delete")
+        with self._lock:
+            store = self._namespaces.get(namespace, {})
+            if delete_all:
+                store.clear()
+            for vector_id in ids or []:
+                store.pop(vector_id, None)
+        return {}
+
+    def list(self, namespace: str = "", limit: int = 100, **_: Any) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            ids = sorted(self._namespaces.get(namespace, {}))
+        for i in range(0, len(ids), limit):
+            yield {"vectors": [{"id": vector_id} for vector_id in ids[i:i + limit]]}
+
+    def describe_index_stats(self, **_: Any) -> Dict[str, Any]:
+        self._call("describe_index_stats")
+        with self._lock:
+            return {"namespaces": {ns: {"vector_count": len(store)} for ns, store in self._namespaces.items()}}
+
+    def query(self, vector: List[float], namespace: str = "", top_k: int = 10, include_metadata: bool = False,
+              **_: Any) -> Dict[str, Any]:
+        self._call("query")
+        return self._search(vector, namespace, top_k, include_metadata)
+
+    def _search(self, vector: List[float], namespace: str, top_k: int, include_metadata: bool) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._namespaces.get(namespace, {}).values())
+        if not entries:
+            return {"matches": []}
+        matrix = np.stack([entry["values"] for entry in entries])
+        scores = matrix @ np.asarray(vector, dtype=np.float32)
+        order = np.argsort(-scores)[:top_k]
+        return {"matches": [
+            {"id": entries[i]["id"], "score": float(scores[i]),
+             "metadata": entries[i]["metadata"] if include_metadata else {}}
+            for i in order
+        ]}
+
+
+class FakeAsyncIndex(FakeIndex):
+    # ``query`` as a coroutine, like Pinecone's IndexAsyncio; writes stay
+    # synchronous for the ingest pipeline.
+    async def query(self, vector: List[float], namespace: str = "", top_k: int = 10,  # type: ignore[override]
+                    include_metadata: bool = False, **_: Any) -> Dict[str, Any]:
+        with self._lock:
+            self.calls["query"] = self.calls.get("query", 0) + 1
+        await self.latency.wait_async()
+        return self._search(vector, namespace, top_k, include_metadata)
+
+
+@contextlib.contextmanager
+def installed(fake: FakeGenai) -> Iterator[FakeGenai]:
+    # Routes rag_logic's Gemini calls to ``fake`` and drops any clients the
+    # shared resource registry built against the real module.
+    import rag_logic
+    import resources
+
+    genai = rag_logic.genai
+    names = ("configure", "embed_content", "embed_content_async", "GenerativeModel")
+    saved = {name: getattr(genai, name) for name in names}
+    for name in names:
+        setattr(genai, name, getattr(fake, name))
+    resources.clear_resources()
+    try:
+        yield fake
+    finally:
+        for name, value in saved.items():
+            setattr(genai, name, value)
+        resources.clear_resources()
@@ -0,0 +1,300 @@
+"""Load test: many concurrent chat sessions against offline stand-ins.
+
+Each simulated session follows the app's flow. It uploads a synthetic PDF
+through a shared ``IngestJobManager``, polls until the job is done, then asks
+``--questions`` questions through ``stream_answer`` and consumes the stream
+the way ``st.write_stream`` does. Questions are in plain words, so each one
+embeds the question and searches the index; ``--exact-ratio`` mixes in
+section-number questions that the lexical index answers locally. Sessions run
+on their own threads, like Streamlit script threads. Gemini and the vector
+index are the fakes from ``benchmarks.fakes``, with log-normal latency around
+realistic medians. Run from the repository root:
+
+    python -m benchmarks.loadtest --sessions 1 2 4 8 16 32 --save load.json
+
+Each concurrency level reports upload and answer latency percentiles, time
+to first token, question throughput and scaling efficiency. The first level
+where doubling sessions adds less than ``--saturation-gain`` throughput, or
+where answer p95 exceeds ``--saturation-p95`` times the single-session p95,
+is reported as the saturation point. Pool sizes come from the usual settings
+(``QUERY_MAX_WORKERS``, ``INGEST_MAX_CONCURRENT``, ``EMBED_MAX_WORKERS``, ...),
+so runs with different values can be compared. ``--async`` runs every
+session as a task on one event loop through ``process_document_async`` and
+``stream_answer_async`` instead.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_pipeline import _configure_environment
+
+
+@dataclass
+class SessionResult:
+    upload_seconds: Optional[float] = None
+    answer_seconds: List[float] = field(default_factory=list)
+    first_token_seconds: List[float] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    # Nearest-rank percentile; None for no samples.
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(q / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(len(ordered), rank) - 1]
+
+
+def _session(args: argparse.Namespace, level: int, number: int, index: Any, jobs: Any, pdf: bytes,
+             start_at: float, result: SessionResult) -> None:
+    import rag_logic
+    from ingest_jobs import STATE_DONE, STATE_FAILED
+
+    time.sleep(max(0.0, start_at - time.perf_counter()))
+    namespace = f"load-{level}-{0 if args.same_document else number}"
+    start = time.perf_counter()
+    job_id = jobs.submit(index, pdf, namespace)
+    while True:
+        job = jobs.status(job_id)
+        if job is None or job.state in (STATE_DONE, STATE_FAILED):
+            break
+        time.sleep(args.poll_ms / 1000.0)
+    result.upload_seconds = time.perf_counter() - start
+    if job is None or job.state == STATE_FAILED:
+        result.errors.append(f"upload: {job.error if job else 'job lost'}")
+        return
+
+    for i in range(args.questions):
+        if args.think_ms:
+            time.sleep(args.think_ms / 1000.0)
+        question = _question(args, number, i)
+        start = time.perf_counter()
+        first_token = None
+        try:
+            for _ in rag_logic.stream_answer(index, question, namespace):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+        except Exception as exc:
+            result.errors.append(f"answer: {exc}")
+            continue
+        result.answer_seconds.append(time.perf_counter() - start)
+        if first_token is not None:
+            result.first_token_seconds.append(first_token)
+
+
+def _question(args: argparse.Namespace, number: int, i: int) -> str:
+    # Plain-language questions take the dense path (query embedding, index
+    # search); ``--exact-ratio`` of them name a section number instead, which
+    # the lexical index answers without either. The mix is spread evenly.
+    from benchmarks.synthetic_pdf import section_question, topic_question
+
+    k = number * args.questions + i
+    if math.floor((k + 1) * args.exact_ratio) > math.floor(k * args.exact_ratio):
+        return section_question(number + i, args.pages)
+    return topic_question(k)
+
+
+async def _session_async(args: argparse.Namespace, level: int, number: int, index: Any, pdf: bytes,
+                         start_at: float, result: SessionResult) -> None:
+    import rag_logic
+
+    await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+    namespace = f"load-{level}-{0 if args.same_document else number}"
+    start = time.perf_counter()
+    try:
+        await rag_logic.process_document_async(index, pdf, namespace)
+    except Exception as exc:
+        result.errors.append(f"upload: {exc}")
+        return
+    finally:
+        result.upload_seconds = time.perf_counter() - start
+
+    for i in range(args.questions):
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000.0)
+        start = time.perf_counter()
+        first_token = None
+        try:
+            async for _ in rag_logic.stream_answer_async(index, _question(args, number, i), namespace):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+        except Exception as exc:
+            result.errors.append(f"answer: {exc}")
+            continue
+        result.answer_seconds.append(time.perf_counter() - start)
+        if first_token is not None:
+            result.first_token_seconds.append(first_token)
+
+
+def run_level(args: argparse.Namespace, level: int, fake: Any) -> Dict[str, Any]:
+    from benchmarks.fakes import FakeAsyncIndex, FakeIndex, Latency
+    from benchmarks.synthetic_pdf import make_pdf
+    from ingest_jobs import IngestJobManager
+    from rag_logic import process_document
+
+    index_type = FakeAsyncIndex if args.use_async else FakeIndex
+    index = index_type(Latency(args.index_latency_ms, args.latency_sigma, seed=level))
+    # Seeds differ per level too, so no level reuses another's embeddings.
+    pdfs = [make_pdf(args.pages, seed=level * 1000 + (0 if args.same_document else n)) for n in range(level)]
+    results = [SessionResult() for _ in range(level)]
+    calls_before = (fake.embed_calls, fake.generate_calls)
+    begin = time.perf_counter()
+    if args.use_async:
+        async def sessions() -> None:
+            await asyncio.gather(*(
+                _session_async(args, level, n, index, pdfs[n], begin + args.ramp_s * n / level, results[n])
+                for n in range(level)
+            ))
+        asyncio.run(sessions())
+    else:
+        jobs = IngestJobManager(process_document)
+        threads = [
+            threading.Thread(
+                target=_session,
+                args=(args, level, n, index, jobs, pdfs[n], begin + args.ramp_s * n / level, results[n]),
+                name=f"session-{n}",
+                daemon=True,
+            )
+            for n in range(level)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - begin
+
+    uploads = [r.upload_seconds for r in results if r.upload_seconds is not None]
+    answers = [s for r in results for s in r.answer_seconds]
+    first_tokens = [s for r in results for s in r.first_token_seconds]
+    errors = [e for r in results for e in r.errors]
+    row: Dict[str, Any] = {
+        "sessions": level,
+        "seconds": round(elapsed, 3),
+        "questions": len(answers),
+        "questions_per_s": round(len(answers) / elapsed, 3) if elapsed else None,
+        "errors": len(errors),
+        "embed_calls": fake.embed_calls - calls_before[0],
+        "generate_calls": fake.generate_calls - calls_before[1],
+        "index_calls": dict(index.calls),
+    }
+    for name, values in (("upload", uploads), ("answer", answers), ("first_token", first_tokens)):
+        for q in (50, 95, 99):
+            value = percentile(values, q)
+            row[f"{name}_p{q}_s"] = round(value, 4) if value is not None else None
+    if errors:
+        row["first_errors"] = errors[:5]
+    return row
+
+
+def find_saturation(rows: List[Dict[str, Any]], min_gain: float, max_p95: float) -> Optional[Dict[str, Any]]:
+    # Annotates each row with its efficiency (throughput per session relative
+    # to the first level) and returns the first saturated level.
+    if not rows:
+        return None
+    first = rows[0]
+    per_session = (first["questions_per_s"] or 0) / first["sessions"]
+    saturated = None
+    for previous, row in zip([None] + rows[:-1], rows):
+        rate = row["questions_per_s"] or 0
+        row["efficiency"] = round(rate / (per_session * row["sessions"]), 3) if per_session else None
+        if previous is None or saturated is not None:
+            continue
+        gain = (rate / previous["questions_per_s"] - 1) if previous["questions_per_s"] else 0.0
+        scale = row["sessions"] / previous["sessions"]
+        # Gain is normalized to a doubling of sessions.
+        per_doubling = (1 + gain) ** (1 / math.log2(scale)) - 1 if scale > 1 and gain > -1 else gain
+        slow = first["answer_p95_s"] and row["answer_p95_s"] and row["answer_p95_s"] > max_p95 * first["answer_p95_s"]
+        if per_doubling < min_gain or slow:
+            saturated = row
+            row["saturated"] = "throughput" if per_doubling < min_gain else "latency"
+    return saturated
+
+
+def _fmt(value: Optional[float], scale: float = 1000.0) -> str:
+    return f"{value * scale:.0f}" if value is not None else "-"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--questions", type=int, default=5, help="Questions per session")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per uploaded document")
+    parser.add_argument("--same-document", action="store_true", help="Every session uploads the same PDF")
+    parser.add_argument("--exact-ratio", type=float, default=0.0,
+                        help="Fraction of questions naming a section number (lexical fast path)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause before each question")
+    parser.add_argument("--ramp-s", type=float, default=0.0, help="Spread session starts over this many seconds")
+    parser.add_argument("--poll-ms", type=float, default=250.0, help="Ingest status poll interval")
+    parser.add_argument("--embed-latency-ms", type=float, default=150.0)
+    parser.add_argument("--index-latency-ms", type=float, default=40.0)
+    parser.add_argument("--generate-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of injected latency")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run sessions as tasks on one event loop through the async API")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the embedding and answer caches on")
+    parser.add_argument("--saturation-gain", type=float, default=0.1,
+                        help="Throughput gain per doubling of sessions below which a level counts as saturated")
+    parser.add_argument("--saturation-p95", type=float, default=2.0,
+                        help="Answer p95, as a multiple of the first level's, above which a level counts as saturated")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    args = parser.parse_args()
+    if not 0.0 <= args.exact_ratio <= 1.0:
+        parser.error("--exact-ratio must be between 0 and 1")
+
+    _configure_environment(args)
+    import rag_logic  # noqa: F401  (after the environment is set)
+    from benchmarks.fakes import FakeGenai, Latency, installed
+
+    fake = FakeGenai(
+        embed_latency=Latency(args.embed_latency_ms, args.latency_sigma),
+        generate_latency=Latency(args.generate_latency_ms, args.latency_sigma, seed=11),
+    )
+    print(f"{'sessions':>8} {'q/s':>8} {'eff':>6} {'upload p50/p95/p99 ms':>24} "
+          f"{'answer p50/p95/p99 ms':>24} {'ttft p50/p95 ms':>16} {'errors':>7}")
+    rows: List[Dict[str, Any]] = []
+    with installed(fake):
+        for level in args.sessions:
+            row = run_level(args, level, fake)
+            rows.append(row)
+            find_saturation(rows, args.saturation_gain, args.saturation_p95)
+            upload = "/".join(_fmt(row[f"upload_p{q}_s"]) for q in (50, 95, 99))
+            answer = "/".join(_fmt(row[f"answer_p{q}_s"]) for q in (50, 95, 99))
+            ttft = "/".join(_fmt(row[f"first_token_p{q}_s"]) for q in (50, 95))
+            efficiency = f"{row['efficiency']:.2f}" if row.get("efficiency") is not None else "-"
+            print(f"{level:>8} {row['questions_per_s'] or 0:>8.2f} {efficiency:>6} {upload:>24} "
+                  f"{answer:>24} {ttft:>16} {row['errors']:>7}", flush=True)
+
+    saturated = find_saturation(rows, args.saturation_gain, args.saturation_p95)
+    if saturated:
+        print(f"\nSaturated at {saturated['sessions']} sessions ({saturated['saturated']}).")
+    else:
+        print("\nNo saturation within the tested levels.")
+
+    if args.save:
+        settings = ("QUERY_MAX_WORKERS", "INGEST_MAX_CONCURRENT", "EMBED_MAX_WORKERS", "UPSERT_MAX_WORKERS")
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": {k: v for k, v in vars(args).items() if k != "save"},
+                "settings": {name: os.environ[name] for name in settings if name in os.environ},
+            },
+            "results": rows,
+            "saturated_at": saturated["sessions"] if saturated else None,
+        }
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Deterministic synthetic PDFs for offline benchmarks.
+
+Pages are written as uncompressed Helvetica text streams, so pypdf extracts
+them the way it extracts real text-layer PDFs, without any PDF library.
+"""
+import random
+from typing import List, Tuple
+
+WORDS = (
+    "the policy section report revenue growth climate data engine insight "
+    "analysis quarterly figure table appendix customer contract term notice"
+).split()
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(rng: random.Random, page: int, words_per_page: int) -> List[str]:
+    lines: List[str] = [f"Section {page}.1 overview"]
+    count = 0
+    while count < words_per_page:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14)))
+        lines.append(sentence.capitalize() + ".")
+        count += sentence.count(" ") + 1
+    return lines
+
+
+def make_pdf(pages: int, words_per_page: int = 350, seed: int = 7) -> bytes:
+    rng = random.Random(seed)
+    objects: List[Tuple[int, str]] = []
+    kids: List[int] = []
+    font = 3 + 2 * pages
+    for page in range(1, pages + 1):
+        content_id = 1 + 2 * page
+        lines = _page_lines(rng, page, words_per_page)
+        stream = "BT /F1 9 Tf 36 1800 Td 11 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append((content_id, f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"))
+        objects.append((
+            content_id + 1,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 1850] /Contents {content_id} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>",
+        ))
+        kids.append(content_id + 1)
+    objects.append((font, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    objects = [
+        (1, "<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"),
+    ] + objects
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number, body in sorted(objects):
+        offsets[number] = len(out)
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    size = max(offsets) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    for number in range(1, size):
+        out += f"{offsets[number]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    return bytes(out)
+
+
+def topic_question(i: int) -> str:
+    # Plain words only: no section numbers, identifiers or quotes, so the
+    # question takes the dense path (query embedding and index search).
+    topics = [word for word in WORDS if word != "the"]
+    first = topics[i % len(topics)]
+    second = topics[(i // len(topics) + i + 1) % len(topics)]
+    return f"What does the document say about {first} and {second}?"
+
+
+def section_question(i: int, pages: int) -> str:
+    # Names a section number, which the lexical index answers on its own
+    # without embedding the question.
+    return f"What does section {1 + i % pages}.1 say about revenue growth?"
@@ -0,0 +1,248 @@
+"""Ingest a directory or manifest of PDFs without the web app.
+
+Text is extracted on a pool of worker processes, one document per task, so
+pypdf parsing scales with the available cores. Extracted documents then go
+through the usual ingest pipeline on ``--concurrent-docs`` threads. Between
+them they keep at most EMBED_MAX_WORKERS embedding and UPSERT_MAX_WORKERS
+upsert calls in flight, and share the optional EMBED_REQUESTS_PER_MINUTE
+limit. Each document's namespace is the md5 of its
+bytes, as for uploads, and documents already indexed are skipped, so an
+interrupted run can simply be restarted. Run from the repository root:
+
+    python bulk_ingest.py archive/ --workers 8 --report ingest.json
+    python bulk_ingest.py --manifest files.txt --shard 0/4 --embed-rpm 1500
+
+``--shard K/N`` processes only the K-th of N disjoint slices of the file
+list, for splitting an archive across hosts.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from doc_registry import namespace_vector_counts
+from pdf_extract import extract_pages, extraction_workers
+from rag_logic import is_ingested, process_document
+from resources import load_environment, vector_index
+from settings import env_int
+
+
+@dataclass
+class BulkStats:
+    documents: int = 0
+    ingested: int = 0
+    skipped: int = 0
+    failed: int = 0
+    pages: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    reused: int = 0
+    upserted: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    failures: List[Dict[str, str]] = field(default_factory=list)
+
+    def rates(self) -> Dict[str, float]:
+        elapsed = self.seconds or 1e-9
+        return {
+            "documents_per_s": round(self.ingested / elapsed, 2),
+            "pages_per_s": round(self.pages / elapsed, 1),
+            "chunks_per_s": round(self.chunks / elapsed, 1),
+            "mb_per_s": round(self.bytes / elapsed / (1024 * 1024), 2),
+        }
+
+
+def _find_pdfs(directory: str) -> List[str]:
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+    return found
+
+
+def _read_manifest(path: str) -> List[str]:
+    # A JSON list of paths, or one path per line ('#' starts a comment).
+    # Relative paths are resolved against the manifest's directory.
+    with open(path, "r", encoding="utf-8") as fh:
+        content = fh.read()
+    if path.endswith(".json"):
+        entries = [str(entry) for entry in json.loads(content)]
+    else:
+        entries = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+    base = os.path.dirname(os.path.abspath(path))
+    return [entry if os.path.isabs(entry) else os.path.join(base, entry) for entry in entries]
+
+
+def _parse_shard(value: str) -> Tuple[int, int]:
+    try:
+        shard, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("shard must look like K/N, e.g. 0/4")
+    if shards < 1 or not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError("shard K/N needs 0 <= K < N")
+    return shard, shards
+
+
+def _in_shard(path: str, shard: Tuple[int, int]) -> bool:
+    # Hashes the path as listed, so every host must list the same files.
+    return int(hashlib.md5(path.encode("utf-8")).hexdigest(), 16) % shard[1] == shard[0]
+
+
+def ingest_files(
+    index: Any,
+    paths: List[str],
+    workers: Optional[int] = None,
+    concurrent_docs: Optional[int] = None,
+    progress_seconds: float = 10.0,
+) -> BulkStats:
+    # A failure is recorded on its own document; the rest still complete.
+    if not index:
+        raise ValueError("Index cannot be None")
+    if workers is None:
+        workers = extraction_workers()
+    if concurrent_docs is None:
+        concurrent_docs = env_int("BULK_INGEST_CONCURRENT_DOCS", 4)
+    workers, concurrent_docs = max(1, workers), max(1, concurrent_docs)
+    stats = BulkStats(documents=len(paths))
+    lock = threading.Lock()
+    # One index stats snapshot serves every skip check in the run.
+    counts = namespace_vector_counts(index)
+    start = time.perf_counter()
+
+    def fail(path: str, error: str) -> None:
+        with lock:
+            stats.failed += 1
+            stats.failures.append({"path": path, "error": error})
+
+    # Extraction futures are queued in submission order; the bounded queue
+    # keeps at most a few documents per worker in memory.
+    pending: "queue.Queue[Optional[Tuple[str, bytes, str, Future]]]" = queue.Queue(maxsize=workers * 2)
+
+    def ingest_worker() -> None:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            path, content, namespace, future = item
+            counters: Dict[str, int] = {}
+            try:
+                process_document(index, content, namespace, progress=lambda _, c: counters.update(c),
+                                 pages=future.result())
+            except Exception as exc:
+                fail(path, str(exc) or type(exc).__name__)
+                continue
+            with lock:
+                stats.ingested += 1
+                stats.bytes += len(content)
+                for name in ("pages", "chunks", "embedded", "reused", "upserted"):
+                    setattr(stats, name, getattr(stats, name) + counters.get(name, 0))
+
+    done = threading.Event()
+
+    def report_progress() -> None:
+        while not done.wait(progress_seconds):
+            with lock:
+                stats.seconds = time.perf_counter() - start
+                finished = stats.ingested + stats.skipped + stats.failed
+                rates = stats.rates()
+            print(
+                f"{finished}/{stats.documents} documents, {rates['pages_per_s']} pages/s, "
+                f"{rates['chunks_per_s']} chunks/s, {stats.failed} failed",
+                file=sys.stderr, flush=True,
+            )
+
+    threads = [threading.Thread(target=ingest_worker, name=f"bulk-ingest-{i}", daemon=True)
+               for i in range(concurrent_docs)]
+    if progress_seconds > 0:
+        threads.append(threading.Thread(target=report_progress, name="bulk-progress", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # Spawned workers import only pdf_extract, so they start quickly. A
+    # worker that dies (e.g. a PDF that exhausts memory) fails the documents
+    # in flight, and a fresh pool takes over for the rest.
+    context = multiprocessing.get_context(os.getenv("PDF_EXTRACT_START_METHOD", "spawn"))
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    seen = set()
+    try:
+        for path in paths:
+            try:
+                with open(path, "rb") as fh:
+                    content = fh.read()
+            except OSError as exc:
+                fail(path, str(exc))
+                continue
+            namespace = hashlib.md5(content).hexdigest()
+            # Duplicates within the archive and documents indexed by an
+            # earlier run are not extracted again.
+            if namespace in seen or is_ingested(index, namespace, namespace, counts):
+                with lock:
+                    stats.skipped += 1
+                continue
+            seen.add(namespace)
+            try:
+                future = pool.submit(extract_pages, content)
+            except BrokenProcessPool:
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                future = pool.submit(extract_pages, content)
+            pending.put((path, content, namespace, future))
+        for _ in range(concurrent_docs):
+            pending.put(None)
+        for thread in threads[:concurrent_docs]:
+            thread.join()
+    finally:
+        done.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", help="Directory searched recursively for *.pdf")
+    parser.add_argument("--manifest", help="Text file with one PDF path per line, or a JSON list")
+    parser.add_argument("--workers", type=int, help="Extraction processes (default PDF_EXTRACT_WORKERS or CPU count)")
+    parser.add_argument("--concurrent-docs", type=int, help="Documents embedded and upserted at once")
+    parser.add_argument("--embed-rpm", type=float, help="Embedding requests per minute (EMBED_REQUESTS_PER_MINUTE)")
+    parser.add_argument("--shard", type=_parse_shard, help="Process only slice K of N, e.g. 0/4")
+    parser.add_argument("--progress-seconds", type=float, default=10.0)
+    parser.add_argument("--report", help="Write the summary and failures as JSON here")
+    args = parser.parse_args()
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+
+    load_environment()
+    if args.embed_rpm:
+        os.environ["EMBED_REQUESTS_PER_MINUTE"] = str(args.embed_rpm)
+    paths = _find_pdfs(args.directory) if args.directory else _read_manifest(args.manifest)
+    if args.shard:
+        paths = [path for path in paths if _in_shard(path, args.shard)]
+
+    stats = ingest_files(vector_index(), paths, args.workers, args.concurrent_docs, args.progress_seconds)
+    rates = stats.rates()
+    print(
+        f"{stats.ingested} ingested, {stats.skipped} skipped, {stats.failed} failed of {stats.documents} "
+        f"in {stats.seconds:.1f}s: {rates['documents_per_s']} docs/s, {rates['pages_per_s']} pages/s, "
+        f"{rates['chunks_per_s']} chunks/s, {rates['mb_per_s']} MB/s "
+        f"({stats.embedded} chunks embedded, {stats.reused} reused, {stats.upserted} vectors upserted)",
+        file=sys.stderr,
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as fh:
+            json.dump({**asdict(stats), **rates}, fh, indent=2)
+    if stats.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from settings import data_dir, env_int
+from sqlite_util import chunked, connect
+
+
+# Local store for chunk text, so vectors can carry only IDs and offsets in
+# their metadata. Each put_many call writes one zlib-compressed block holding
+# the batch's texts back to back; a chunk row records its block and the
+# (offset, length) of its UTF-8 bytes inside the decompressed block. A query's
+# top-k texts are read with one lookup over the chunk rows and one per
+# distinct block.
+class ChunkStore:
+    def __init__(self, path: Optional[str] = None, level: Optional[int] = None):
+        self.path = path or os.path.join(data_dir(), "chunks.sqlite3")
+        self.level = level if level is not None else env_int("CHUNK_STORE_COMPRESSION_LEVEL", 6)
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS blocks (id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "namespace TEXT NOT NULL, id TEXT NOT NULL, block INTEGER NOT NULL, "
+            "offset INTEGER NOT NULL, length INTEGER NOT NULL, PRIMARY KEY (namespace, id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_block ON chunks(block)")
+        self._conn.commit()
+
+    def put_many(self, namespace: str, items: Dict[str, str]) -> None:
+        if not items:
+            return
+        rows: List[Tuple[str, int, int]] = []
+        parts: List[bytes] = []
+        offset = 0
+        for vector_id, text in items.items():
+            encoded = text.encode("utf-8")
+            rows.append((vector_id, offset, len(encoded)))
+            parts.append(encoded)
+            offset += len(encoded)
+        block = zlib.compress(b"".join(parts), self.level)
+        with self._lock:
+            # Only blocks holding chunks this batch replaces can become orphans.
+            replaced = self._blocks_of(namespace, list(items))
+            cursor = self._conn.execute("INSERT INTO blocks (data) VALUES (?)", (block,))
+            block_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (namespace, id, block, offset, length) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, vector_id, block_id, start, length) for vector_id, start, length in rows],
+            )
+            self._drop_orphan_blocks(replaced)
+            self._conn.commit()
+
+    def get_many(self, namespace: str, ids: Sequence[str]) -> Dict[str, str]:
+        unique = list(dict.fromkeys(ids))
+        located: List[Tuple[str, int, int, int]] = []
+        blocks: Dict[int, bytes] = {}
+        with self._lock:
+            for batch, placeholders in chunked(unique):
+                located.extend(self._conn.execute(
+                    f"SELECT id, block, offset, length FROM chunks WHERE namespace = ? AND id IN ({placeholders})",
+                    [namespace, *batch],
+                ).fetchall())
+            block_ids = sorted({block for _, block, _, _ in located})
+            for batch, placeholders in chunked(block_ids):
+                for block_id, data in self._conn.execute(
+                    f"SELECT id, data FROM blocks WHERE id IN ({placeholders})", batch
+                ):
+                    blocks[block_id] = data
+        # Decompression happens outside the lock, once per distinct block.
+        decompressed = {block_id: zlib.decompress(data) for block_id, data in blocks.items()}
+        return {
+            vector_id: decompressed[block][start:start + length].decode("utf-8")
+            for vector_id, block, start, length in located
+            if block in decompressed
+        }
+
+    def delete(self, namespace: str, ids: Optional[Sequence[str]] = None) -> None:
+        with self._lock:
+            if ids is None:
+                affected = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT block FROM chunks WHERE namespace = ?", (namespace,)
+                )]
+                self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            else:
+                affected = self._blocks_of(namespace, ids)
+                self._conn.executemany(
+                    "DELETE FROM chunks WHERE namespace = ? AND id = ?", [(namespace, vector_id) for vector_id in ids]
+                )
+            self._drop_orphan_blocks(affected)
+            self._conn.commit()
+
+    def _blocks_of(self, namespace: str, ids: Sequence[str]) -> List[int]:
+        blocks = set()
+        unique = list(dict.fromkeys(ids))
+        for batch, placeholders in chunked(unique):
+            blocks.update(row[0] for row in self._conn.execute(
+                f"SELECT block FROM chunks WHERE namespace = ? AND id IN ({placeholders})", [namespace, *batch]
+            ))
+        return sorted(blocks)
+
+    def _drop_orphan_blocks(self, blocks: Sequence[int]) -> None:
+        # Of ``blocks``, those whose chunks were all replaced or deleted; the
+        # check uses the chunks_block index, so it does not scan the table.
+        for batch, placeholders in chunked(blocks):
+            self._conn.execute(
+                f"DELETE FROM blocks WHERE id IN ({placeholders}) "
+                "AND NOT EXISTS (SELECT 1 FROM chunks WHERE chunks.block = blocks.id)",
+                batch,
+            )
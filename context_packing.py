@@ -0,0 +1,75 @@
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class Passage:
+    text: str
+    score: float
+    # Offsets into the document text; None for chunks indexed without them.
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+    # Namespace the chunk came from; passages only merge within one source.
+    source: str = ""
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _merge_overlapping(passages: List[Passage]) -> List[Passage]:
+    # Adjacent chunks share ``overlap`` characters; passages whose offsets
+    # touch or overlap are joined so the shared text appears once. The
+    # overlap is checked against the texts themselves, so offsets recorded
+    # by an earlier revision of the document never splice unrelated text.
+    located = sorted((p for p in passages if p.char_start is not None and p.char_end is not None),
+                     key=lambda p: (p.source, p.char_start, p.char_end))
+    merged: List[Passage] = []
+    for passage in located:
+        if merged and merged[-1].source == passage.source:
+            last = merged[-1]
+            shared = last.char_end - passage.char_start
+            if 0 <= shared <= len(passage.text) and last.text.endswith(passage.text[:shared]):
+                if passage.char_end > last.char_end:
+                    last.text += passage.text[shared:]
+                    last.char_end = passage.char_end
+                last.score = max(last.score, passage.score)
+                continue
+        merged.append(Passage(passage.text, passage.score, passage.char_start, passage.char_end, passage.source))
+    seen = {(p.source, p.text) for p in merged}
+    for passage in passages:
+        if passage.char_start is None or passage.char_end is None:
+            if (passage.source, passage.text) not in seen:
+                seen.add((passage.source, passage.text))
+                merged.append(passage)
+    return merged
+
+
+def pack_context(passages: List[Passage], min_score: float, max_tokens: int) -> List[Passage]:
+    # Drops passages scoring below ``min_score`` (the best one is always
+    # kept), merges overlapping neighbours, then fills ``max_tokens`` in order
+    # of relevance. A passage that no longer fits is skipped in favour of
+    # smaller ones; if even the best does not fit it is truncated.
+    passages = [p for p in passages if p.text]
+    if not passages:
+        return []
+    best = max(passages, key=lambda p: p.score)
+    kept = [p for p in passages if p.score >= min_score or p is best]
+    groups = sorted(_merge_overlapping(kept), key=lambda p: -p.score)
+
+    packed: List[Passage] = []
+    remaining = max_tokens if max_tokens > 0 else None
+    for group in groups:
+        if remaining is None:
+            packed.append(group)
+            continue
+        cost = estimate_tokens(group.text)
+        if cost <= remaining:
+            packed.append(group)
+            remaining -= cost
+        elif not packed:
+            packed.append(replace(group, text=group.text[:remaining * CHARS_PER_TOKEN]))
+            remaining = 0
+    return packed
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from settings import data_dir
+from sqlite_util import connect
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETE = "complete"
+
+# Namespace states as seen by the ingest path.
+STATE_MISSING = "missing"
+STATE_PARTIAL = "partial"
+STATE_COMPLETE = "complete"
+# Fully indexed, but from different file contents than the upload.
+STATE_REVISED = "revised"
+
+
+def namespace_vector_counts(index: Any) -> Dict[str, int]:
+    # One describe_index_stats call for every namespace, so a caller checking
+    # many documents can take a single snapshot.
+    try:
+        stats = index.describe_index_stats()
+    except Exception:
+        return {}
+    counts: Dict[str, int] = {}
+    for namespace, summary in (stats.get("namespaces") or {}).items():
+        if hasattr(summary, "get"):
+            counts[namespace] = int(summary.get("vector_count", 0) or 0)
+        else:
+            counts[namespace] = int(getattr(summary, "vector_count", 0) or 0)
+    return counts
+
+
+def namespace_vector_count(index: Any, namespace: str) -> int:
+    return namespace_vector_counts(index).get(namespace, 0)
+
+
+# Local manifest of namespaces written by process_document, in SQLite beside
+# the other local stores. An entry is marked in progress before the first
+# upsert and complete with its final vector count once every batch has
+# landed, so an interrupted ingest is recognisable on the next upload of the
+# same file.
+class DocumentRegistry:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(data_dir(), "registry.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "namespace TEXT PRIMARY KEY, status TEXT NOT NULL, vector_count INTEGER, "
+            "content_hash TEXT, updated_at REAL NOT NULL)"
+        )
+        # The vector IDs of each namespace's current revision, so a re-ingest
+        # can diff against them without listing the index.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vector_ids ("
+            "namespace TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (namespace, id)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._import_json(os.path.join(os.path.dirname(self.path), "registry.json"))
+
+    def _import_json(self, json_path: str) -> None:
+        # Earlier versions kept the manifest in registry.json and the IDs in
+        # one text file per namespace; they are copied in once.
+        if not os.path.exists(json_path):
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone():
+                return
+        try:
+            with open(json_path, "r", encoding="utf-8") as fh:
+                entries = json.load(fh)
+        except (OSError, json.JSONDecodeError):
+            return
+        ids_dir = f"{os.path.splitext(json_path)[0]}_ids"
+        with self._lock:
+            for namespace, entry in entries.items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                    (namespace, entry.get("status", STATUS_IN_PROGRESS), entry.get("vector_count"),
+                     entry.get("content_hash"), entry.get("updated_at", time.time())),
+                )
+                ids_path = os.path.join(ids_dir, f"{hashlib.md5(namespace.encode()).hexdigest()}.txt")
+                if os.path.exists(ids_path):
+                    with open(ids_path, "r", encoding="utf-8") as fh:
+                        self._conn.executemany(
+                            "INSERT OR IGNORE INTO vector_ids VALUES (?, ?)",
+                            ((namespace, line.strip()) for line in fh if line.strip()),
+                        )
+            self._conn.commit()
+
+    def get(self, namespace: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, vector_count, content_hash, updated_at FROM documents WHERE namespace = ?",
+                (namespace,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("status", "vector_count", "content_hash", "updated_at"), row))
+
+    def mark_in_progress(self, namespace: str) -> None:
+        # The previous revision's count and hash are kept until it is replaced.
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO documents (namespace, status, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                (namespace, STATUS_IN_PROGRESS, time.time()),
+            )
+            self._conn.commit()
+
+    def mark_complete(self, namespace: str, vector_count: int, content_hash: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                (namespace, STATUS_COMPLETE, vector_count, content_hash, time.time()),
+            )
+            self._conn.commit()
+
+    def forget(self, namespace: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE namespace = ?", (namespace,))
+            self._conn.execute("DELETE FROM vector_ids WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def vector_ids(self, namespace: str) -> Optional[Set[str]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM vector_ids WHERE namespace = ?", (namespace,)).fetchall()
+        return {row[0] for row in rows} or None
+
+    def set_vector_ids(self, namespace: str, vector_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM vector_ids WHERE namespace = ?", (namespace,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO vector_ids VALUES (?, ?)", ((namespace, vector_id) for vector_id in vector_ids)
+            )
+            self._conn.commit()
+
+    # IDs are added as an ingest writes them, before any store or the index
+    # holds them, so an interrupted revision's vectors can still be cleaned up.
+    def add_vector_ids(self, namespace: str, vector_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO vector_ids VALUES (?, ?)", ((namespace, vector_id) for vector_id in vector_ids)
+            )
+            self._conn.commit()
+
+    def state(
+        self, index: Any, namespace: str, content_hash: Optional[str] = None,
+        counts: Optional[Dict[str, int]] = None,
+    ) -> str:
+        # ``counts`` is a namespace_vector_counts snapshot to use instead of
+        # asking the index again.
+        entry = self.get(namespace)
+        indexed = counts.get(namespace, 0) if counts is not None else namespace_vector_count(index, namespace)
+        if entry and entry.get("status") == STATUS_COMPLETE:
+            expected = int(entry.get("vector_count", 0) or 0)
+            if expected and indexed >= expected:
+                # Entries written before content hashes were recorded belong
+                # to md5-named namespaces, where the name is the hash.
+                recorded = entry.get("content_hash") or namespace
+                if content_hash is None or recorded == content_hash:
+                    return STATE_COMPLETE
+                return STATE_REVISED
+        if entry or indexed:
+            # Either our own ingest stopped part way, or vectors exist that
+            # this node never recorded; both are repaired rather than redone.
+            return STATE_PARTIAL
+        return STATE_MISSING
@@ -0,0 +1,208 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from google.api_core import exceptions as google_exceptions
+
+from settings import env_float, env_int
+
+# batchEmbedContents accepts at most 100 requests per call.
+API_MAX_BATCH_ITEMS = 100
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+)
+
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_limiter: Optional["RateLimiter"] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # One pool per process, so concurrent ingests share the embedding quota
+    # instead of each opening its own set of connections.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, env_int("EMBED_MAX_WORKERS", 4)),
+                thread_name_prefix="embed",
+            )
+        return _executor
+
+
+def embed_slots() -> threading.BoundedSemaphore:
+    # Ingest embedding calls hold a slot for their round-trip, so documents
+    # ingested at once share EMBED_MAX_WORKERS calls in flight between them.
+    global _slots
+    with _executor_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max(1, env_int("EMBED_MAX_WORKERS", 4)))
+        return _slots
+
+
+class RateLimiter:
+    # Spaces requests evenly at ``per_minute``. One limiter is shared by every
+    # thread and event loop in the process, so concurrent ingests and
+    # questions together stay under the project's embedding quota.
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # Claims the next slot and returns how long to wait for it.
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            return slot - now
+
+
+def rate_limiter() -> Optional[RateLimiter]:
+    # EMBED_REQUESTS_PER_MINUTE > 0 caps embedding API calls, retries
+    # included; unset or 0 leaves them unthrottled.
+    global _limiter
+    per_minute = env_float("EMBED_REQUESTS_PER_MINUTE", 0.0)
+    if per_minute <= 0:
+        return None
+    with _executor_lock:
+        if _limiter is None or _limiter.interval != 60.0 / per_minute:
+            _limiter = RateLimiter(per_minute)
+        return _limiter
+
+
+def throttled(fn: Callable[[], Any]) -> Any:
+    limiter = rate_limiter()
+    if limiter:
+        delay = limiter.reserve()
+        if delay > 0:
+            time.sleep(delay)
+    return fn()
+
+
+async def throttled_async(fn: Callable[[], Awaitable[Any]]) -> Any:
+    limiter = rate_limiter()
+    if limiter:
+        delay = limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    return await fn()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, RETRYABLE_EXCEPTIONS):
+        return True
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    try:
+        return int(code) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    # Full jitter keeps parallel workers that were throttled together from
+    # retrying in lockstep.
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def _retry_settings(
+    max_attempts: Optional[int], base_delay: Optional[float], max_delay: Optional[float]
+) -> Tuple[int, float, float]:
+    # Arguments left as None fall back to the EMBED_* settings.
+    if max_attempts is None:
+        max_attempts = max(1, env_int("EMBED_MAX_ATTEMPTS", 6))
+    if base_delay is None:
+        base_delay = env_float("EMBED_RETRY_BASE_SECONDS", 0.5)
+    if max_delay is None:
+        max_delay = env_float("EMBED_RETRY_MAX_SECONDS", 30.0)
+    return max_attempts, base_delay, max_delay
+
+
+def call_with_retry(
+    fn: Callable[[], Any],
+    max_attempts: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    max_delay: Optional[float] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
+    max_attempts, base_delay, max_delay = _retry_settings(max_attempts, base_delay, max_delay)
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as exc:
+            attempt += 1
+            if attempt >= max_attempts or not is_retryable(exc):
+                raise
+            sleep(backoff_delay(attempt - 1, base_delay, max_delay))
+
+
+async def call_with_retry_async(
+    fn: Callable[[], Awaitable[Any]],
+    max_attempts: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    max_delay: Optional[float] = None,
+) -> Any:
+    # ``call_with_retry`` for coroutines; backoff sleeps yield the event loop.
+    max_attempts, base_delay, max_delay = _retry_settings(max_attempts, base_delay, max_delay)
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as exc:
+            attempt += 1
+            if attempt >= max_attempts or not is_retryable(exc):
+                raise
+            await asyncio.sleep(backoff_delay(attempt - 1, base_delay, max_delay))
+
+
+def plan_batches(texts: Sequence[str], max_items: int, max_chars: int) -> List[Tuple[int, int]]:
+    batches: List[Tuple[int, int]] = []
+    start = 0
+    chars = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_items or chars + len(text) > max_chars):
+            batches.append((start, i))
+            start, chars = i, 0
+        chars += len(text)
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def batch_limits() -> Tuple[int, int]:
+    max_items = min(API_MAX_BATCH_ITEMS, max(1, env_int("EMBED_BATCH_SIZE", API_MAX_BATCH_ITEMS)))
+    max_chars = max(1, env_int("EMBED_BATCH_MAX_CHARS", 200_000))
+    return max_items, max_chars
+
+
+def embed_in_batches(texts: Sequence[str], embed_batch: Callable[[List[str]], Any]) -> np.ndarray:
+    # Returns a contiguous float32 matrix with one row per input text.
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    max_items, max_chars = batch_limits()
+    batches = plan_batches(texts, max_items, max_chars)
+
+    def run(span: Tuple[int, int]) -> np.ndarray:
+        batch = list(texts[span[0]:span[1]])
+        embeddings = np.asarray(call_with_retry(lambda: throttled(lambda: embed_batch(batch))), dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(batch):
+            raise RuntimeError(f"Embedding API returned {embeddings.shape[0]} vectors for {len(batch)} inputs")
+        return embeddings
+
+    if len(batches) == 1:
+        return run(batches[0])
+    # Futures are collected in submission order, so output order always
+    # matches input order regardless of which batch finishes first.
+    futures = [_get_executor().submit(run, span) for span in batches]
+    return np.concatenate([future.result() for future in futures])
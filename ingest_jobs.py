@@ -0,0 +1,126 @@
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Optional
+
+from settings import env_int
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+# Pipeline stages overlap, so a job reports the furthest one reached.
+STAGE_ORDER = ["queued", "checking", "extracting", "embedding", "upserting", "done"]
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    namespace: str
+    content_hash: str = ""
+    state: str = STATE_QUEUED
+    stage: str = "queued"
+    page_count: int = 0
+    pages_extracted: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    vectors_upserted: int = 0
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in (STATE_QUEUED, STATE_RUNNING)
+
+    @property
+    def fraction(self) -> float:
+        # Half the bar tracks extraction, half tracks vectors landing in the
+        # index; the chunk total is only known once extraction finishes.
+        # Chunks carried over unchanged from an earlier revision count as landed.
+        if self.state == STATE_DONE:
+            return 1.0
+        extracted = self.pages_extracted / self.page_count if self.page_count else 0.0
+        landed = self.vectors_upserted + self.chunks_reused
+        upserted = landed / self.chunks_created if self.chunks_created else 0.0
+        return min(0.99, 0.5 * extracted + 0.5 * upserted)
+
+
+# Runs process_document on a bounded pool of its own, so at most
+# INGEST_MAX_CONCURRENT documents are ingested at once and the rest wait in
+# the pool's queue, while Streamlit's script threads stay free for chat.
+class IngestJobManager:
+    def __init__(self, ingest: Callable[..., bool], max_concurrent: Optional[int] = None):
+        if max_concurrent is None:
+            max_concurrent = env_int("INGEST_MAX_CONCURRENT", 2)
+        self._ingest = ingest
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrent), thread_name_prefix="ingest-job")
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self.retention_seconds = env_int("INGEST_JOB_RETENTION_SECONDS", 3600)
+
+    def submit(self, index: Any, document_content: bytes, namespace: str) -> str:
+        content_hash = hashlib.md5(document_content or b"").hexdigest()
+        with self._lock:
+            self._prune()
+            # The same document already queued or running is not ingested
+            # twice. Different contents for a namespace that is still being
+            # ingested are refused: the two revisions would diff against
+            # each other's half-written vectors.
+            for job in self._jobs.values():
+                if job.namespace == namespace and job.active:
+                    if job.content_hash == content_hash:
+                        return job.job_id
+                    raise ValueError("Another version of this document is still being processed. Try again shortly.")
+            job = IngestJob(job_id=uuid.uuid4().hex, namespace=namespace, content_hash=content_hash)
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job.job_id, index, document_content)
+        return job.job_id
+
+    def status(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return replace(job) if job else None
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            stage = fields.pop("stage", None)
+            if stage and STAGE_ORDER.index(stage) > STAGE_ORDER.index(job.stage):
+                job.stage = stage
+            for name, value in fields.items():
+                setattr(job, name, value)
+
+    def _run(self, job_id: str, index: Any, document_content: bytes) -> None:
+        self._update(job_id, state=STATE_RUNNING, stage="checking", started_at=time.time())
+        namespace = self._jobs[job_id].namespace
+
+        def progress(stage: str, stats: Dict[str, int]) -> None:
+            self._update(
+                job_id,
+                stage=stage,
+                page_count=stats["page_count"],
+                pages_extracted=stats["pages"],
+                chunks_created=stats["chunks"],
+                chunks_embedded=stats["embedded"],
+                chunks_reused=stats.get("reused", 0),
+                vectors_upserted=stats["upserted"],
+            )
+
+        try:
+            self._ingest(index, document_content, namespace, progress=progress)
+        except Exception as exc:
+            self._update(job_id, state=STATE_FAILED, error=str(exc) or type(exc).__name__, finished_at=time.time())
+        else:
+            self._update(job_id, state=STATE_DONE, stage="done", finished_at=time.time())
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [j.job_id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
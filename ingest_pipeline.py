@@ -0,0 +1,180 @@
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from settings import env_int
+
+Stage = Tuple[str, Callable[[Iterator[Any]], Iterator[Any]], Callable[[Any], int]]
+
+_DONE = object()
+POLL_SECONDS = 0.1
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+# Caps the bytes buffered in one channel. A single item larger than the budget
+# is still admitted when the channel is empty, so an oversized page cannot
+# stall it. Each channel has its own budget: with one shared budget, items
+# waiting in an upstream channel could hold bytes that only the (blocked)
+# downstream stages would ever release.
+class ByteBudget:
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.used = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int, cancelled: threading.Event) -> None:
+        with self._cond:
+            while self.used and self.used + size > self.limit:
+                if cancelled.is_set():
+                    raise PipelineCancelled()
+                self._cond.wait(POLL_SECONDS)
+            self.used += size
+            self.peak = max(self.peak, self.used)
+
+    def release(self, size: int) -> None:
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+class _Channel:
+    def __init__(self, budget: ByteBudget, sizeof: Callable[[Any], int], cancelled: threading.Event, depth: int):
+        self._queue: "queue.Queue[Tuple[Any, int]]" = queue.Queue(maxsize=max(1, depth))
+        self._budget = budget
+        self._sizeof = sizeof
+        self._cancelled = cancelled
+
+    def put(self, item: Any) -> None:
+        size = 0 if item is _DONE else self._sizeof(item)
+        if size:
+            self._budget.acquire(size, self._cancelled)
+        while True:
+            if self._cancelled.is_set() and item is not _DONE:
+                self._budget.release(size)
+                raise PipelineCancelled()
+            try:
+                self._queue.put((item, size), timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        # The end marker must get through even after a failure so consumers
+        # stop; once cancelled, buffered items are dropped to make room.
+        while True:
+            try:
+                self._queue.put((_DONE, 0), timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                if not self._cancelled.is_set():
+                    continue
+                try:
+                    _, size = self._queue.get_nowait()
+                    self._budget.release(size)
+                except queue.Empty:
+                    pass
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            try:
+                item, size = self._queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if self._cancelled.is_set():
+                    raise PipelineCancelled()
+                continue
+            if item is _DONE:
+                return
+            self._budget.release(size)
+            yield item
+
+
+def run_pipeline(
+    source: Iterable[Any],
+    source_sizeof: Callable[[Any], int],
+    stages: Sequence[Stage],
+    sink: Callable[[Any], None],
+    max_buffer_bytes: Optional[int] = None,
+) -> List[ByteBudget]:
+    # Runs the source and each stage on its own thread, connected by bounded
+    # channels, and drains the last channel into ``sink`` on the caller's
+    # thread. The first error cancels every stage and is re-raised here.
+    if max_buffer_bytes is None:
+        max_buffer_bytes = env_int("INGEST_MAX_BUFFER_MB", 64) * 1024 * 1024
+    depth = env_int("INGEST_QUEUE_DEPTH", 8)
+    cancelled = threading.Event()
+    errors: List[BaseException] = []
+
+    # The buffer cap is split evenly across the channels. A stage blocked on
+    # a full channel waits only on its consumer, and the last channel drains
+    # into the sink, so every blocked put is eventually released.
+    sizeofs = [source_sizeof] + [sizeof for _, _, sizeof in stages]
+    budgets = [ByteBudget(max_buffer_bytes // len(sizeofs)) for _ in sizeofs]
+    channels = [_Channel(budget, sizeof, cancelled, depth) for budget, sizeof in zip(budgets, sizeofs)]
+
+    def pump(items: Iterable[Any], out: _Channel) -> None:
+        try:
+            for item in items:
+                out.put(item)
+        except PipelineCancelled:
+            pass
+        except BaseException as exc:
+            errors.append(exc)
+            cancelled.set()
+        finally:
+            out.close()
+
+    threads = [threading.Thread(target=pump, args=(source, channels[0]), name="ingest-source", daemon=True)]
+    for i, (name, transform, _) in enumerate(stages):
+        threads.append(threading.Thread(
+            target=pump,
+            args=(_lazy(transform, channels[i]), channels[i + 1]),
+            name=f"ingest-{name}",
+            daemon=True,
+        ))
+    for thread in threads:
+        thread.start()
+    try:
+        for item in channels[-1]:
+            sink(item)
+    except PipelineCancelled:
+        pass
+    except BaseException as exc:
+        errors.append(exc)
+        cancelled.set()
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return budgets
+
+
+def _lazy(transform: Callable[[Iterator[Any]], Iterator[Any]], channel: _Channel) -> Iterator[Any]:
+    yield from transform(iter(channel))
+
+
+def map_ordered(fn: Callable[[Any], Any], items: Iterable[Any], window: int) -> Iterator[Any]:
+    # Keeps up to ``window`` calls in flight and yields results in input
+    # order, so a stage overlaps its own network round-trips.
+    if window <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    pending: Deque["Future[Any]"] = deque()
+    with ThreadPoolExecutor(max_workers=window, thread_name_prefix="ingest-io") as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,200 @@
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from settings import data_dir, env_float, env_int
+from sqlite_util import chunked, connect
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words and dotted/dashed/underscored compounds such as section numbers
+# ("4.2.1") and identifiers ("ISO-27001", "max_retries").
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_QUOTED = re.compile(r"[\"“”]([^\"“”]{3,})[\"“”]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how in is it of on or the this that to was what when where "
+    "which who why with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    # Compounds are indexed whole and by their parts, so "4.2" matches both
+    # the exact section number and a plain "4".
+    tokens: List[str] = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[._\-/]", token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+def _is_identifier(token: str) -> bool:
+    return not token.isalnum() or (any(c.isdigit() for c in token) and len(token) > 1)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+@dataclass
+class LexicalResult:
+    matches: List[Dict[str, Any]] = field(default_factory=list)
+    # True when the question quotes a phrase, names identifiers or pastes a
+    # passage that the top match contains verbatim.
+    confident: bool = False
+
+
+def _identifiers(question: str) -> List[str]:
+    # Identifiers as written in the question; the parts of a compound alone
+    # ("27001" of "ISO-27001") do not count.
+    tokens = (token for token in _TOKEN.findall(question.lower()) if token not in _STOPWORDS)
+    return [token for token in dict.fromkeys(tokens) if _is_identifier(token)]
+
+
+# BM25 inverted index over chunk text, one per namespace, in SQLite beside the
+# other local stores. Chunk text is kept compressed with its offsets so
+# lexical matches can go straight into context packing.
+class LexicalIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(data_dir(), "lexical.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "namespace TEXT NOT NULL, id TEXT NOT NULL, length INTEGER NOT NULL, text BLOB NOT NULL, "
+            "metadata TEXT NOT NULL, PRIMARY KEY (namespace, id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "namespace TEXT NOT NULL, term TEXT NOT NULL, id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (namespace, term, id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings(namespace, id)")
+        self._conn.commit()
+
+    def add_many(self, namespace: str, chunks: Sequence[Tuple[str, str, Dict[str, Any]]]) -> None:
+        # ``chunks`` are (vector_id, text, metadata) triples; metadata is
+        # returned with each match (offsets, pages).
+        docs = []
+        postings = []
+        for vector_id, text, metadata in chunks:
+            counts = Counter(tokenize(text))
+            docs.append((namespace, vector_id, sum(counts.values()), zlib.compress(text.encode("utf-8")),
+                         json.dumps(metadata)))
+            postings.extend((namespace, term, vector_id, tf) for term, tf in counts.items())
+        if not docs:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM postings WHERE namespace = ? AND id = ?", [(namespace, doc[1]) for doc in docs]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (namespace, id, length, text, metadata) VALUES (?, ?, ?, ?, ?)", docs
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO postings (namespace, term, id, tf) VALUES (?, ?, ?, ?)", postings
+            )
+            self._conn.commit()
+
+    def delete(self, namespace: str, ids: Optional[Sequence[str]] = None) -> None:
+        with self._lock:
+            if ids is None:
+                self._conn.execute("DELETE FROM postings WHERE namespace = ?", (namespace,))
+                self._conn.execute("DELETE FROM docs WHERE namespace = ?", (namespace,))
+            else:
+                pairs = [(namespace, vector_id) for vector_id in ids]
+                self._conn.executemany("DELETE FROM postings WHERE namespace = ? AND id = ?", pairs)
+                self._conn.executemany("DELETE FROM docs WHERE namespace = ? AND id = ?", pairs)
+            self._conn.commit()
+
+    def search(self, namespace: str, question: str, top_k: int) -> LexicalResult:
+        terms = list(dict.fromkeys(tokenize(question)))
+        if not terms:
+            return LexicalResult()
+        with self._lock:
+            doc_count, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE namespace = ?", (namespace,)
+            ).fetchone()
+            if not doc_count:
+                return LexicalResult()
+            placeholders = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                f"SELECT term, id, tf FROM postings WHERE namespace = ? AND term IN ({placeholders})",
+                [namespace, *terms],
+            ).fetchall()
+            lengths = self._lookup(namespace, sorted({row[1] for row in rows}), "length")
+
+        df = Counter(term for term, _, _ in rows)
+        average = total_length / doc_count
+        scores: Dict[str, float] = {}
+        doc_terms: Dict[str, set] = {}
+        for term, vector_id, tf in rows:
+            idf = math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(vector_id, average) / average)
+            scores[vector_id] = scores.get(vector_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            doc_terms.setdefault(vector_id, set()).add(term)
+
+        phrases = [_normalize(p) for p in _QUOTED.findall(question)]
+        ranked = sorted(scores, key=lambda vector_id: -scores[vector_id])[:max(top_k, 1) * 2]
+        with self._lock:
+            texts = self._lookup(namespace, ranked, "text")
+            metadata = self._lookup(namespace, ranked, "metadata")
+        texts = {vector_id: zlib.decompress(blob).decode("utf-8") for vector_id, blob in texts.items()}
+        normalized = {vector_id: _normalize(text) for vector_id, text in texts.items()}
+        if phrases:
+            # Chunks holding every quoted phrase outrank the rest.
+            ranked.sort(key=lambda vector_id: not all(p in normalized.get(vector_id, "") for p in phrases))
+        ranked = ranked[:top_k]
+        identifiers = _identifiers(question)
+        matches = []
+        for vector_id in ranked:
+            meta = json.loads(metadata.get(vector_id, "{}"))
+            meta["text"] = texts.get(vector_id, "")
+            # Exact matches hold every quoted phrase, or (without quotes) one
+            # of the identifiers the question names.
+            text = normalized.get(vector_id, "")
+            if phrases:
+                exact = all(phrase in text for phrase in phrases)
+            else:
+                exact = any(term in doc_terms[vector_id] for term in identifiers)
+            matches.append({"id": vector_id, "score": scores[vector_id], "metadata": meta, "exact": exact})
+        confident = bool(ranked) and self._confident(
+            question, terms, phrases, df, doc_count, doc_terms[ranked[0]], normalized.get(ranked[0], "")
+        )
+        return LexicalResult(matches, confident)
+
+    def _lookup(self, namespace: str, ids: List[str], column: str) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        for batch, placeholders in chunked(ids):
+            found.update(self._conn.execute(
+                f"SELECT id, {column} FROM docs WHERE namespace = ? AND id IN ({placeholders})", [namespace, *batch]
+            ).fetchall())
+        return found
+
+    def _confident(
+        self, question: str, terms: List[str], phrases: List[str], df: Counter, doc_count: int,
+        top_terms: set, top_text: str,
+    ) -> bool:
+        if phrases:
+            return all(phrase in top_text for phrase in phrases)
+        # A pasted passage found verbatim.
+        pasted = _normalize(question).rstrip("?.! ")
+        if len(pasted.split()) >= env_int("LEXICAL_MIN_PASTE_WORDS", 6) and pasted in top_text:
+            return True
+        # Identifiers and section numbers that are rare in the document and
+        # all present in the top match.
+        identifiers = [term for term in terms if _is_identifier(term)]
+        if not identifiers or not all(term in top_terms for term in identifiers):
+            return False
+        # Overlapping neighbours share text, so two chunks is still rare.
+        rare = max(2, int(doc_count * env_float("LEXICAL_RARE_FRACTION", 0.05)))
+        return min(df[term] for term in identifiers) <= rare
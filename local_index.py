@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+
+from settings import data_dir, env_flag, env_int
+from sqlite_util import chunked, connect
+
+INITIAL_CAPACITY = 1024
+
+
+class _Namespace:
+    # One namespace: a float32 matrix memory-mapped from disk, the row of each
+    # vector ID, and an optional inverted-file (IVF) partition of the rows for
+    # approximate search. Metadata stays in SQLite and is read only for the
+    # rows a query returns.
+    def __init__(self, directory: str, name: str, dimension: int, capacity: int):
+        self.name = name
+        self.dimension = dimension
+        self.capacity = capacity
+        self.path = os.path.join(directory, f"{_safe_name(name)}.f32")
+        self.matrix = self._open(capacity)
+        self.row_ids: List[Optional[str]] = [None] * capacity
+        self.id_rows: Dict[str, int] = {}
+        self.live = np.zeros(capacity, dtype=bool)
+        self.free: List[int] = []
+        self.high_water = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+        self.built_count = 0
+        self.dirty_rows: Set[int] = set()
+
+    def _open(self, capacity: int) -> np.memmap:
+        required = capacity * self.dimension * 4
+        mode = "r+" if os.path.exists(self.path) else "w+"
+        if mode == "r+" and os.path.getsize(self.path) < required:
+            with open(self.path, "r+b") as fh:
+                fh.truncate(required)
+        return np.memmap(self.path, dtype=np.float32, mode=mode, shape=(capacity, self.dimension))
+
+    def grow(self, needed: int) -> None:
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        self.matrix.flush()
+        del self.matrix
+        self.matrix = self._open(capacity)
+        self.row_ids.extend([None] * (capacity - self.capacity))
+        live = np.zeros(capacity, dtype=bool)
+        live[:self.capacity] = self.live
+        self.live = live
+        if self.assignments is not None:
+            assignments = np.full(capacity, -1, dtype=np.int32)
+            assignments[:self.capacity] = self.assignments
+            self.assignments = assignments
+        self.capacity = capacity
+
+    def allocate(self) -> int:
+        if self.free:
+            return self.free.pop()
+        if self.high_water >= self.capacity:
+            self.grow(self.high_water + 1)
+        row = self.high_water
+        self.high_water += 1
+        return row
+
+    @property
+    def count(self) -> int:
+        return len(self.id_rows)
+
+
+def _safe_name(namespace: str) -> str:
+    readable = "".join(c if c.isalnum() or c in "-_" else "_" for c in namespace[:64])
+    return f"{readable}-{hashlib.md5(namespace.encode()).hexdigest()[:8]}"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# Embedded, on-disk stand-in for a Pinecone ``Index`` handle. It implements the
+# subset of the data-plane API this app uses (upsert, query, fetch, delete,
+# describe_index_stats) and returns plain dicts, which support the same
+# ``.get(...)`` access as the Pinecone response objects. Scores are cosine
+# similarities, matching a Pinecone index created with the cosine metric.
+class LocalIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("LOCAL_INDEX_PATH") or os.path.join(data_dir(), "local_index")
+        os.makedirs(self.path, exist_ok=True)
+        self.approximate = env_flag("LOCAL_INDEX_APPROXIMATE", False)
+        self.approximate_min_vectors = env_int("LOCAL_INDEX_APPROXIMATE_MIN_VECTORS", 50_000)
+        self.nprobe = max(1, env_int("LOCAL_INDEX_NPROBE", 8))
+        self._lock = threading.RLock()
+        self._conn = connect(os.path.join(self.path, "index.sqlite3"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS namespaces (name TEXT PRIMARY KEY, dimension INTEGER NOT NULL, capacity INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "namespace TEXT NOT NULL, id TEXT NOT NULL, row INTEGER NOT NULL, metadata TEXT, "
+            "PRIMARY KEY (namespace, id))"
+        )
+        self._conn.commit()
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._load()
+
+    def _load(self) -> None:
+        for name, dimension, capacity in self._conn.execute("SELECT name, dimension, capacity FROM namespaces").fetchall():
+            ns = _Namespace(self.path, name, dimension, capacity)
+            rows = self._conn.execute("SELECT id, row FROM vectors WHERE namespace = ?", (name,)).fetchall()
+            for vector_id, row in rows:
+                ns.row_ids[row] = vector_id
+                ns.id_rows[vector_id] = row
+                ns.live[row] = True
+            ns.high_water = max((row for _, row in rows), default=-1) + 1
+            ns.free = [row for row in range(ns.high_water) if not ns.live[row]]
+            self._namespaces[name] = ns
+
+    def _namespace(self, namespace: str, dimension: int) -> _Namespace:
+        ns = self._namespaces.get(namespace)
+        if ns is None:
+            ns = _Namespace(self.path, namespace, dimension, INITIAL_CAPACITY)
+            self._namespaces[namespace] = ns
+        elif ns.dimension != dimension:
+            raise ValueError(
+                f"Vector dimension {dimension} does not match namespace '{namespace}' dimension {ns.dimension}"
+            )
+        return ns
+
+    def upsert(self, vectors: List[Any], namespace: str = "", **_: Any) -> Dict[str, Any]:
+        if not vectors:
+            return {"upserted_count": 0}
+        ids = [v["id"] for v in vectors]
+        values = _normalize(np.asarray([v["values"] for v in vectors], dtype=np.float32))
+        metadata = [json.dumps(v.get("metadata") or {}) for v in vectors]
+        with self._lock:
+            ns = self._namespace(namespace, values.shape[1])
+            rows = []
+            for vector_id in ids:
+                row = ns.id_rows.get(vector_id)
+                if row is None:
+                    row = ns.allocate()
+                    ns.id_rows[vector_id] = row
+                    ns.row_ids[row] = vector_id
+                    ns.live[row] = True
+                rows.append(row)
+                if ns.centroids is not None:
+                    ns.dirty_rows.add(row)
+            ns.matrix[rows] = values
+            ns.matrix.flush()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO namespaces (name, dimension, capacity) VALUES (?, ?, ?)",
+                (namespace, ns.dimension, ns.capacity),
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (namespace, id, row, metadata) VALUES (?, ?, ?, ?)",
+                [(namespace, vector_id, row, meta) for vector_id, row, meta in zip(ids, rows, metadata)],
+            )
+            self._conn.commit()
+        return {"upserted_count": len(ids)}
+
+    def _candidate_rows(self, ns: _Namespace, query: np.ndarray) -> Optional[np.ndarray]:
+        if not self.approximate or ns.count < self.approximate_min_vectors:
+            return None
+        if ns.centroids is None or ns.count > ns.built_count * 1.2 or ns.count < ns.built_count * 0.8:
+            self._build_ivf(ns)
+        assert ns.centroids is not None and ns.assignments is not None
+        probes = np.argsort(ns.centroids @ query)[-self.nprobe:]
+        selected = np.isin(ns.assignments[:ns.high_water], probes)
+        if ns.dirty_rows:
+            selected[list(ns.dirty_rows)] = True
+        return np.flatnonzero(selected & ns.live[:ns.high_water])
+
+    def _build_ivf(self, ns: _Namespace) -> None:
+        # A few rounds of spherical k-means over a sample; rows touched after
+        # the build are tracked as dirty and always scanned exactly.
+        rows = np.flatnonzero(ns.live[:ns.high_water])
+        lists = max(1, int(np.sqrt(len(rows))))
+        rng = np.random.default_rng(0)
+        sample = ns.matrix[rng.choice(rows, size=min(len(rows), lists * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=lists, replace=False)]
+        for _ in range(10):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(lists):
+                members = sample[labels == k]
+                if len(members):
+                    centroids[k] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+        assignments = np.full(ns.capacity, -1, dtype=np.int32)
+        for start in range(0, len(rows), 65_536):
+            block = rows[start:start + 65_536]
+            assignments[block] = np.argmax(ns.matrix[block] @ centroids.T, axis=1)
+        ns.centroids = centroids
+        ns.assignments = assignments
+        ns.built_count = ns.count
+        ns.dirty_rows = set()
+
+    def query(
+        self,
+        namespace: str = "",
+        vector: Optional[List[float]] = None,
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        **_: Any,
+    ) -> Dict[str, Any]:
+        if vector is None:
+            raise ValueError("A query vector is required")
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None or not ns.count:
+                return {"matches": [], "namespace": namespace}
+            query = _normalize(np.asarray(vector, dtype=np.float32)[np.newaxis, :])[0]
+            candidates = self._candidate_rows(ns, query)
+            if candidates is None:
+                scores = np.asarray(ns.matrix[:ns.high_water] @ query)
+                scores[~ns.live[:ns.high_water]] = -np.inf
+                rows = np.arange(ns.high_water)
+            else:
+                scores = np.asarray(ns.matrix[candidates] @ query)
+                rows = candidates
+            k = min(top_k, int(np.isfinite(scores).sum()))
+            if k <= 0:
+                return {"matches": [], "namespace": namespace}
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            matches = [{"id": ns.row_ids[int(rows[i])], "score": float(scores[i])} for i in top]
+            if include_values:
+                for match, i in zip(matches, top):
+                    match["values"] = ns.matrix[int(rows[i])].tolist()
+            if include_metadata:
+                found = self._metadata(namespace, [m["id"] for m in matches])
+                for match in matches:
+                    match["metadata"] = found.get(match["id"], {})
+        return {"matches": matches, "namespace": namespace}
+
+    def _metadata(self, namespace: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        for batch, placeholders in chunked(ids):
+            for vector_id, metadata in self._conn.execute(
+                f"SELECT id, metadata FROM vectors WHERE namespace = ? AND id IN ({placeholders})",
+                [namespace, *batch],
+            ):
+                found[vector_id] = json.loads(metadata) if metadata else {}
+        return found
+
+    def fetch(self, ids: Iterable[str], namespace: str = "", **_: Any) -> Dict[str, Any]:
+        ids = list(ids)
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                return {"vectors": {}, "namespace": namespace}
+            present = [vector_id for vector_id in ids if vector_id in ns.id_rows]
+            metadata = self._metadata(namespace, present)
+            vectors = {
+                vector_id: {
+                    "id": vector_id,
+                    "values": ns.matrix[ns.id_rows[vector_id]].tolist(),
+                    "metadata": metadata.get(vector_id, {}),
+                }
+                for vector_id in present
+            }
+        return {"vectors": vectors, "namespace": namespace}
+
+    def list(self, namespace: str = "", prefix: Optional[str] = None, limit: int = 100, **_: Any) -> Iterator[Dict[str, Any]]:
+        # Pages of IDs, shaped like Pinecone's list() responses.
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            ids = sorted(ns.id_rows) if ns is not None else []
+        if prefix:
+            ids = [vector_id for vector_id in ids if vector_id.startswith(prefix)]
+        for i in range(0, len(ids), max(1, limit)):
+            yield {"vectors": [{"id": vector_id} for vector_id in ids[i:i + limit]], "namespace": namespace}
+
+    def delete(
+        self, ids: Optional[Iterable[str]] = None, namespace: str = "", delete_all: bool = False, **_: Any
+    ) -> Dict[str, Any]:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                return {}
+            if delete_all:
+                del self._namespaces[namespace]
+                del ns.matrix
+                self._conn.execute("DELETE FROM vectors WHERE namespace = ?", (namespace,))
+                self._conn.execute("DELETE FROM namespaces WHERE name = ?", (namespace,))
+                self._conn.commit()
+                if os.path.exists(ns.path):
+                    os.remove(ns.path)
+                return {}
+            doomed = [vector_id for vector_id in (ids or []) if vector_id in ns.id_rows]
+            for vector_id in doomed:
+                row = ns.id_rows.pop(vector_id)
+                ns.row_ids[row] = None
+                ns.live[row] = False
+                ns.free.append(row)
+                ns.dirty_rows.discard(row)
+            self._conn.executemany(
+                "DELETE FROM vectors WHERE namespace = ? AND id = ?", [(namespace, vector_id) for vector_id in doomed]
+            )
+            self._conn.commit()
+        return {}
+
+    def describe_index_stats(self, **_: Any) -> Dict[str, Any]:
+        with self._lock:
+            namespaces = {name: {"vector_count": ns.count} for name, ns in self._namespaces.items()}
+            dimension = next((ns.dimension for ns in self._namespaces.values()), None)
+        return {
+            "namespaces": namespaces,
+            "dimension": dimension,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+        }
+
+
+_open_lock = threading.Lock()
+_open_indexes: Dict[str, LocalIndex] = {}
+
+
+def open_local_index(path: Optional[str] = None) -> LocalIndex:
+    # Each directory must be owned by a single LocalIndex per process, since
+    # the row maps are held in memory; Streamlit reruns share this instance.
+    resolved = os.path.abspath(path or os.getenv("LOCAL_INDEX_PATH") or os.path.join(data_dir(), "local_index"))
+    with _open_lock:
+        index = _open_indexes.get(resolved)
+        if index is None:
+            index = LocalIndex(resolved)
+            _open_indexes[resolved] = index
+        return index
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import BinaryIO, Callable, Deque, Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader
+
+from settings import env_int
+
+# Kept free of the Gemini and Pinecone imports so spawned extraction workers
+# start quickly.
+
+_worker_file: Optional[BinaryIO] = None
+_worker_reader: Optional[PdfReader] = None
+
+
+def _normalize_page(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+def _init_worker(path: str) -> None:
+    # Workers read the document from a shared temp file rather than each
+    # receiving a pickled copy of it; pypdf reads pages from the open file on
+    # demand.
+    global _worker_file, _worker_reader
+    _worker_file = open(path, "rb")
+    _worker_reader = PdfReader(_worker_file)
+
+
+def _extract_range(start: int, end: int) -> List[str]:
+    assert _worker_reader is not None
+    return [_normalize_page(_worker_reader.pages[i].extract_text()) for i in range(start, end)]
+
+
+def extraction_workers() -> int:
+    return max(1, env_int("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+
+
+def extract_pages(content: bytes) -> List[Tuple[int, str]]:
+    # Whole-document serial extraction, for callers that spread work across
+    # documents rather than across the pages of one (bulk ingest workers).
+    reader = PdfReader(BytesIO(content))
+    if not reader.pages:
+        raise ValueError("PDF contains zero pages")
+    return [(number, _normalize_page(page.extract_text())) for number, page in enumerate(reader.pages, start=1)]
+
+
+def iter_pdf_pages(
+    content: bytes, on_page_count: Optional[Callable[[int], None]] = None
+) -> Iterator[Tuple[int, str]]:
+    # Yields (page_number, normalized_text) in page order, page numbers from 1.
+    reader = PdfReader(BytesIO(content))
+    page_count = len(reader.pages)
+    if page_count == 0:
+        raise ValueError("PDF contains zero pages")
+    if on_page_count:
+        on_page_count(page_count)
+
+    # Pool start-up costs more than it saves on short documents, so each
+    # worker gets at least PDF_PARALLEL_MIN_PAGES pages.
+    min_pages = max(1, env_int("PDF_PARALLEL_MIN_PAGES", 32))
+    workers = min(extraction_workers(), page_count // min_pages)
+    if workers <= 1:
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, _normalize_page(page.extract_text())
+        return
+    del reader
+
+    pages_per_task = max(1, env_int("PDF_PAGES_PER_TASK", 8))
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    workers = min(workers, len(ranges))
+    # Spawned workers are safe to start from the threads Streamlit and the
+    # ingest pipeline run on; each worker parses the document once.
+    context = multiprocessing.get_context(os.getenv("PDF_EXTRACT_START_METHOD", "spawn"))
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(content)
+        yield from _extract_in_pool(path, ranges, workers, context)
+    finally:
+        os.unlink(path)
+
+
+def _extract_in_pool(
+    path: str, ranges: List[Tuple[int, int]], workers: int, context: multiprocessing.context.BaseContext
+) -> Iterator[Tuple[int, str]]:
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(path,),
+    ) as pool:
+        # Only a couple of ranges per worker are in flight, so extracted text
+        # waiting for an earlier range stays bounded.
+        pending: Deque[Tuple[int, "Future[List[str]]"]] = deque()
+        remaining = iter(ranges)
+        window = workers * 2
+        try:
+            for start, end in remaining:
+                pending.append((start, pool.submit(_extract_range, start, end)))
+                if len(pending) >= window:
+                    break
+            while pending:
+                start, future = pending.popleft()
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+                next_range = next(remaining, None)
+                if next_range is not None:
+                    pending.append((next_range[0], pool.submit(_extract_range, *next_range)))
+        finally:
+            for _, future in pending:
+                future.cancel()
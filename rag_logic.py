@@ -1,12 +1,119 @@
+import asyncio
+import contextlib
+import functools
 import os
 import hashlib
-import math
-from io import BytesIO
-from typing import Any, List
+import heapq
+import inspect
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
 
-from pypdf import PdfReader
 import google.generativeai as genai
 
+from answer_cache import AnswerCache
+from chunk_store import ChunkStore
+from context_packing import Passage, pack_context
+from doc_registry import DocumentRegistry, STATE_COMPLETE, STATE_MISSING, STATE_PARTIAL, STATE_REVISED
+from embedding_cache import EmbeddingCache, embedding_key
+from embedding_scheduler import (
+    batch_limits, call_with_retry_async, embed_in_batches, embed_slots, plan_batches, throttled_async,
+)
+from ingest_pipeline import map_ordered, run_pipeline
+from lexical_index import LexicalIndex
+from pdf_extract import iter_pdf_pages
+from rerank_store import RerankStore
+from resources import async_vector_index, configure_genai, generative_model
+from settings import env_flag, env_float, env_int
+import tracing
+from vector_upsert import upsert_slots, upsert_with_retry, vector_payload_size
+
+FETCH_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+MIN_CHUNK_CHARS = 50
+
+ANSWER_MODEL = "gemini-2.5-flash"
+GENERATION_CONFIG = {"temperature": 0.0, "max_output_tokens": 1024}
+
+# One namespace, or several to answer across documents.
+Namespaces = Union[str, Sequence[str]]
+
+_state_lock = threading.Lock()
+_registry: Optional[DocumentRegistry] = None
+_embedding_cache: Optional[EmbeddingCache] = None
+_answer_cache: Optional[AnswerCache] = None
+_chunk_store: Optional[ChunkStore] = None
+_rerank_store: Optional[RerankStore] = None
+_lexical_index: Optional[LexicalIndex] = None
+_query_pool: Optional[ThreadPoolExecutor] = None
+_ingest_pool: Optional[ThreadPoolExecutor] = None
+# Namespace -> md5 of the contents being ingested into it in this process.
+_ingesting: Dict[str, str] = {}
+_ingesting_changed = threading.Condition()
+
+
+def _get_registry() -> DocumentRegistry:
+    global _registry
+    with _state_lock:
+        if _registry is None:
+            _registry = DocumentRegistry()
+        return _registry
+
+
+def _get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _embedding_cache
+    if not env_flag("EMBEDDING_CACHE", True):
+        return None
+    with _state_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
+
+
+def _get_answer_cache() -> Optional[AnswerCache]:
+    global _answer_cache
+    if not env_flag("ANSWER_CACHE", True):
+        return None
+    with _state_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
+
+
+def _get_chunk_store() -> Optional[ChunkStore]:
+    global _chunk_store
+    if not env_flag("CHUNK_STORE", False):
+        return None
+    with _state_lock:
+        if _chunk_store is None:
+            _chunk_store = ChunkStore()
+        return _chunk_store
+
+
+def _get_rerank_store() -> Optional[RerankStore]:
+    global _rerank_store
+    if not _coarse_dimension():
+        return None
+    with _state_lock:
+        if _rerank_store is None:
+            _rerank_store = RerankStore()
+        return _rerank_store
+
+
+def _get_lexical_index() -> Optional[LexicalIndex]:
+    global _lexical_index
+    if not env_flag("LEXICAL_INDEX", True):
+        return None
+    with _state_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex()
+        return _lexical_index
+
 
 def _require_env(var_name: str) -> str:
     value = os.getenv(var_name)
@@ -16,26 +123,22 @@ def _require_env(var_name: str) -> str:
 
 
 def _extract_text_from_pdf(content: bytes) -> str:
-    reader = PdfReader(BytesIO(content))
-    if len(reader.pages) == 0:
-        raise ValueError("PDF contains zero pages")
-    text_parts: List[str] = []
-    for page in reader.pages:
-        page_text = page.extract_text() or ""
-        text_parts.append(page_text)
-    text = " ".join(text_parts)
-    text = " ".join(text.split())
+    text = " ".join(page for _, page in iter_pdf_pages(content) if page)
     if not text:
         raise ValueError("No extractable text found in the PDF")
     return text
 
 
-def _normalize_vector(vector: List[float]) -> List[float]:
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
     # For reduced-dimensional embeddings, normalize for stable cosine behavior.
-    magnitude = math.sqrt(sum((v * v) for v in vector))
-    if magnitude == 0:
-        return vector
-    return [v / magnitude for v in vector]
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _normalize_vector(vector: Sequence[float]) -> np.ndarray:
+    return _normalize_rows(np.asarray(vector, dtype=np.float32)[np.newaxis, :])[0]
 
 
 def _embedding_config() -> tuple[str, int]:
@@ -53,125 +156,1138 @@ def _embedding_config() -> tuple[str, int]:
     return model, dimension
 
 
+def _coarse_dimension() -> int:
+    # Two-stage retrieval: RETRIEVAL_COARSE_DIMENSION > 0 indexes only the
+    # first N components of each (Matryoshka) embedding and reranks the
+    # candidates locally at the full GOOGLE_EMBEDDING_DIMENSION.
+    coarse = env_int("RETRIEVAL_COARSE_DIMENSION", 0)
+    _, dimension = _embedding_config()
+    return coarse if 0 < coarse < dimension else 0
+
+
+def _embed_texts(texts: List[str], task_type: str, title: Optional[str] = None) -> np.ndarray:
+    # Returns raw (unnormalized) embeddings as a float32 matrix, one row per
+    # text, in input order.
+    with tracing.span("embed", task_type=task_type, items=len(texts), bytes=sum(len(t) for t in texts)) as span:
+        return _embed_texts_traced(texts, task_type, title, span)
+
+
+def _embed_texts_traced(texts: List[str], task_type: str, title: Optional[str], span: tracing.Span) -> np.ndarray:
+    keys, found, missing = _embedding_lookup(texts, task_type, title, span)
+    if missing:
+        def embed_batch(batch: List[str]) -> List[List[float]]:
+            return _embedding_values(genai.embed_content(**_embedding_request(batch, task_type, title)))
+
+        embeddings = embed_in_batches(list(missing.values()), embed_batch)
+        _store_embeddings(found, dict(zip(missing.keys(), embeddings)))
+    return _stack_embeddings(keys, found)
+
+
+def _embedding_lookup(
+    texts: List[str], task_type: str, title: Optional[str], span: tracing.Span
+) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, str]]:
+    # Returns (keys, cached embeddings, texts to embed by key). Only cache
+    # misses go to the API; identical texts within one call are embedded once.
+    embedding_model, embedding_dimension = _embedding_config()
+    keys = [embedding_key(embedding_model, embedding_dimension, task_type, title, t) for t in texts]
+    cache = _get_embedding_cache()
+    found: Dict[str, np.ndarray] = cache.get_many(keys) if cache else {}
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    span.set(api_items=len(missing))
+    if cache:
+        hits = sum(1 for key in keys if key in found)
+        tracing.count("embedding_cache_hit", hits)
+        tracing.count("embedding_cache_miss", len(keys) - hits)
+    return keys, found, missing
+
+
+def _embedding_request(batch: List[str], task_type: str, title: Optional[str]) -> Dict[str, Any]:
+    embedding_model, embedding_dimension = _embedding_config()
+    request: Dict[str, Any] = {
+        "model": embedding_model,
+        "content": batch,
+        "task_type": task_type,
+        "output_dimensionality": embedding_dimension,
+    }
+    if title:
+        request["title"] = title
+    return request
+
+
+def _embedding_values(result: Any) -> List[List[float]]:
+    return result["embedding"] if isinstance(result, dict) else result.embedding
+
+
+def _store_embeddings(found: Dict[str, np.ndarray], fresh: Dict[str, np.ndarray]) -> None:
+    cache = _get_embedding_cache()
+    if cache:
+        cache.put_many(fresh)
+    found.update(fresh)
+
+
+def _stack_embeddings(keys: List[str], found: Dict[str, np.ndarray]) -> np.ndarray:
+    if not keys:
+        return np.empty((0, _embedding_config()[1]), dtype=np.float32)
+    return np.stack([found[key] for key in keys])
+
+
+def embed_questions(questions: List[str]) -> np.ndarray:
+    # Normalized query embeddings, one row per question, requested in as few
+    # batched calls as the API allows; cached embeddings are not re-requested.
+    configure_genai(_require_env("GOOGLE_API_KEY"))
+    return _normalize_rows(_embed_texts(questions, "RETRIEVAL_QUERY"))
+
+
+async def _embed_texts_async(texts: List[str], task_type: str, title: Optional[str] = None) -> np.ndarray:
+    # Same contract and cache as ``_embed_texts``; API batches are awaited
+    # concurrently on the async Gemini client instead of the embed pool, and
+    # the SQLite cache is read and written off the event loop.
+    with tracing.span("embed", task_type=task_type, items=len(texts), bytes=sum(len(t) for t in texts)) as span:
+        keys, found, missing = await asyncio.to_thread(_embedding_lookup, texts, task_type, title, span)
+        if missing:
+            pending = list(missing.values())
+            max_items, max_chars = batch_limits()
+
+            async def embed_batch(start: int, end: int) -> np.ndarray:
+                batch = pending[start:end]
+                result = await call_with_retry_async(lambda: throttled_async(
+                    lambda: genai.embed_content_async(**_embedding_request(batch, task_type, title))
+                ))
+                embeddings = np.asarray(_embedding_values(result), dtype=np.float32)
+                if embeddings.ndim != 2 or embeddings.shape[0] != len(batch):
+                    raise RuntimeError(f"Embedding API returned {embeddings.shape[0]} vectors for {len(batch)} inputs")
+                return embeddings
+
+            batches = await asyncio.gather(*(
+                embed_batch(start, end) for start, end in plan_batches(pending, max_items, max_chars)
+            ))
+            fresh = dict(zip(missing.keys(), np.concatenate(batches)))
+            await asyncio.to_thread(_store_embeddings, found, fresh)
+        return _stack_embeddings(keys, found)
+
+
+def _chunk_spans(
+    text: str, max_chunk_size: int, overlap: int, start: int = 0, final: bool = True
+) -> Tuple[List[Tuple[int, int]], int]:
+    # Single pass over character offsets. Each chunk ends at the last sentence
+    # terminator inside its window (else the last space, else a hard cut) and
+    # the next one starts exactly ``overlap`` characters before that end.
+    # With final=False, chunks whose window would reach the end of ``text``
+    # are left for the caller to resume at the returned offset once more text
+    # has arrived; the spans produced are the same as over the whole text.
+    if overlap >= max_chunk_size:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+    spans: List[Tuple[int, int]] = []
+    length = len(text)
+    pos = start
+    while pos < length:
+        limit = pos + max_chunk_size
+        if limit >= length:
+            if not final:
+                break
+            end = length
+        else:
+            end = max(text.rfind(".", pos, limit), text.rfind("!", pos, limit), text.rfind("?", pos, limit)) + 1
+            if end <= pos + overlap:
+                end = text.rfind(" ", pos + overlap + 1, limit)
+                if end <= pos + overlap:
+                    end = limit
+        spans.append((pos, end))
+        if end >= length:
+            pos = length
+            break
+        pos = end - overlap
+    return spans, pos
+
+
+def _iter_chunks(
+    pages: Iterable[Tuple[int, str]], max_chunk_size: int = 1500, overlap: int = 200
+) -> Iterator[Tuple[str, int, int, int, int]]:
+    # Yields (chunk, char_start, char_end, first_page, last_page), with
+    # offsets into the page texts joined by single spaces. Only the text not
+    # yet covered by a finished chunk is buffered between pages.
+    buffer = ""
+    base = 0
+    resume = 0
+    page_offsets: List[int] = []
+    page_numbers: List[int] = []
+
+    def emit(spans: List[Tuple[int, int]]) -> Iterator[Tuple[str, int, int, int, int]]:
+        for span_start, span_end in spans:
+            if span_end - span_start <= MIN_CHUNK_CHARS:
+                continue
+            doc_start, doc_end = base + span_start, base + span_end
+            first_page = page_numbers[bisect_right(page_offsets, doc_start) - 1]
+            last_page = page_numbers[bisect_right(page_offsets, doc_end - 1) - 1]
+            yield buffer[span_start:span_end], doc_start, doc_end, first_page, last_page
+
+    for page_number, text in pages:
+        if not text:
+            continue
+        if base or buffer:
+            buffer += " "
+        page_offsets.append(base + len(buffer))
+        page_numbers.append(page_number)
+        buffer += text
+        spans, resume = _chunk_spans(buffer, max_chunk_size, overlap, resume, final=False)
+        yield from emit(spans)
+        buffer = buffer[resume:]
+        base += resume
+        resume = 0
+        # Drop page boundaries that end before the buffered text begins.
+        keep = max(0, bisect_right(page_offsets, base) - 1)
+        if keep:
+            del page_offsets[:keep]
+            del page_numbers[:keep]
+    if buffer:
+        spans, _ = _chunk_spans(buffer, max_chunk_size, overlap, resume, final=True)
+        yield from emit(spans)
+
+
 def _chunk_text(text: str, max_chunk_size: int = 1500, overlap: int = 200) -> List[str]:
     if not text or not text.strip():
         return []
-    sentences = text.replace("!", ".").replace("?", ".").split(".")
-    sentences = [s.strip() + "." for s in sentences if s.strip()]
-
-    chunks: List[str] = []
-    current = ""
-    for sentence in sentences:
-        if len(current) + len(sentence) > max_chunk_size:
-            if current:
-                chunks.append(current.strip())
-                words = current.split()
-                overlap_text = " ".join(words[-overlap // 10:]) if len(words) > overlap // 10 else ""
-                current = (overlap_text + " " + sentence).strip() if overlap_text else sentence
-            else:
-                chunks.append(sentence[:max_chunk_size])
-                current = sentence[max_chunk_size:]
-        else:
-            current = (current + " " + sentence).strip() if current else sentence
-    if current.strip():
-        chunks.append(current.strip())
-    return [c for c in chunks if len(c.strip()) > 50]
+    return [chunk for chunk, *_ in _iter_chunks([(1, text.strip())], max_chunk_size, overlap)]
 
 
-def process_document(index: Any, document_content: bytes, namespace: str) -> bool:
-    if not index:
-        raise ValueError("Index cannot be None")
-    if not document_content:
-        raise ValueError("Document content cannot be empty")
-    if not namespace or not namespace.strip():
-        raise ValueError("Namespace cannot be empty")
+# A chunk as it moves through ingestion.
+@dataclass
+class _Chunk:
+    position: int
+    vector_id: str
+    text: str
+    char_start: int
+    char_end: int
+    page_start: int
+    page_end: int
 
-    # Configure Generative AI
-    genai.configure(api_key=_require_env("GOOGLE_API_KEY"))
 
-    # Only PDF is supported in this minimal setup
-    if not document_content.startswith(b"%PDF"):
-        raise ValueError("Unsupported file type. Only PDF is supported in this setup.")
+def _vector_id(chunk: str) -> str:
+    # Content-addressed: an unchanged chunk keeps its ID across revisions of a
+    # document, which is what lets a re-ingest skip it.
+    return hashlib.md5(chunk.encode()).hexdigest()
 
-    full_text = _extract_text_from_pdf(document_content)
-    chunks = _chunk_text(full_text, max_chunk_size=1500)
-    if not chunks:
-        raise ValueError("Failed to create any text chunks from the document")
 
-    embedding_model, embedding_dimension = _embedding_config()
-    result = genai.embed_content(
-        model=embedding_model,
-        content=chunks,
-        task_type="RETRIEVAL_DOCUMENT",
-        title="Document Chunks",
-        output_dimensionality=embedding_dimension
-    )
-    embeddings: List[List[float]] = result["embedding"] if isinstance(result, dict) else result.embedding
+def _fetch_existing_ids(index: Any, namespace: str, vector_ids: List[str]) -> Set[str]:
+    existing: Set[str] = set()
+    for i in range(0, len(vector_ids), FETCH_BATCH_SIZE):
+        batch = vector_ids[i:i + FETCH_BATCH_SIZE]
+        fetched = index.fetch(ids=batch, namespace=namespace).get("vectors") or {}
+        existing.update(fetched.keys())
+    return existing
+
 
+def _list_vector_ids(index: Any, namespace: str) -> Optional[Set[str]]:
+    # Only used when the registry has no record of a namespace's IDs; not
+    # every index type supports listing.
+    if not hasattr(index, "list"):
+        return None
+    ids: Set[str] = set()
+    try:
+        for page in index.list(namespace=namespace):
+            items = page.get("vectors", []) if hasattr(page, "get") else page
+            for item in items:
+                ids.add(item if isinstance(item, str) else item["id"])
+    except Exception:
+        return None
+    return ids
+
+
+def _delete_vectors(index: Any, namespace: str, vector_ids: List[str]) -> None:
+    for i in range(0, len(vector_ids), DELETE_BATCH_SIZE):
+        index.delete(ids=vector_ids[i:i + DELETE_BATCH_SIZE], namespace=namespace)
+
+
+def _build_vectors(
+    namespace: str, revision: str, batch: List[_Chunk], embeddings: np.ndarray, include_text: bool = True
+) -> List[Dict[str, Any]]:
+    # Values stay as float32 rows here; vector_upsert converts them to lists
+    # only when the request is sent. With the local chunk store the text is
+    # left out of the metadata and looked up by vector ID at query time.
+    normalized = _normalize_rows(embeddings)
     vectors = []
-    for i, (chunk, vector) in enumerate(zip(chunks, embeddings)):
-        normalized_vector = _normalize_vector(vector)
-        chunk_hash = hashlib.md5(chunk.encode()).hexdigest()[:8]
-        vector_id = f"{namespace}-{chunk_hash}-{i}"
+    for chunk, values in zip(batch, normalized):
+        metadata = {"text": chunk.text} if include_text else {}
         vectors.append({
-            "id": vector_id,
-            "values": normalized_vector,
+            "id": chunk.vector_id,
+            "values": values,
             "metadata": {
-                "text": chunk,
-                "chunk_index": i,
+                **metadata,
+                "chunk_index": chunk.position,
                 "namespace": namespace,
-                "char_count": len(chunk),
+                "revision": revision,
+                "char_count": len(chunk.text),
+                "char_start": chunk.char_start,
+                "char_end": chunk.char_end,
+                "page_start": chunk.page_start,
+                "page_end": chunk.page_end,
                 "file_type": "pdf"
             }
         })
+    return vectors
+
+
+def _vectors_size(vectors: List[Dict[str, Any]]) -> int:
+    return sum(v["values"].nbytes + len(v["metadata"].get("text", "")) for v in vectors)
+
 
-    # Upsert in batches
-    batch_size = 50
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i:i + batch_size]
-        index.upsert(vectors=batch, namespace=namespace)
+def process_document(
+    index: Any,
+    document_content: bytes,
+    namespace: str,
+    progress: Optional[Callable[[str, Dict[str, int]], None]] = None,
+    pages: Optional[Sequence[Tuple[int, str]]] = None,
+) -> bool:
+    # ``progress`` is called as progress(stage, counters) from the pipeline
+    # threads as pages are extracted and batches are embedded and upserted.
+    # ``pages`` are (page_number, text) pairs already extracted from
+    # ``document_content`` elsewhere, e.g. by bulk-ingest worker processes.
+    with tracing.span("ingest", namespace=namespace or "", bytes=len(document_content or b"")) as span:
+        span.set(**_ingest_document(index, document_content, namespace, progress, pages))
     return True
 
 
-def get_answer(index: Any, question: str, namespace: str) -> str:
+def is_ingested(
+    index: Any, namespace: str, content_hash: str, counts: Optional[Dict[str, int]] = None
+) -> bool:
+    # Whether ``content_hash`` is fully indexed under ``namespace``; ``counts``
+    # is a namespace_vector_counts snapshot for callers checking many documents.
+    return _get_registry().state(index, namespace, content_hash, counts) == STATE_COMPLETE
+
+
+def indexed_content_hash(namespace: str) -> Optional[str]:
+    # md5 of the contents recorded for ``namespace``; "" when an entry exists
+    # without one, None when nothing has been ingested under it.
+    entry = _get_registry().get(namespace)
+    if not entry:
+        return None
+    return entry.get("content_hash") or ""
+
+
+def _ingest_executor() -> ThreadPoolExecutor:
+    # Async ingests share one bounded pool (INGEST_MAX_CONCURRENT), so a burst
+    # of uploads queues here instead of filling the loop's default executor.
+    global _ingest_pool
+    with _state_lock:
+        if _ingest_pool is None:
+            _ingest_pool = ThreadPoolExecutor(
+                max_workers=max(1, env_int("INGEST_MAX_CONCURRENT", 2)),
+                thread_name_prefix="ingest-async",
+            )
+        return _ingest_pool
+
+
+async def process_document_async(
+    index: Any,
+    document_content: bytes,
+    namespace: str,
+    progress: Optional[Callable[[str, Dict[str, int]], None]] = None,
+) -> bool:
+    # Extraction is CPU-bound and already runs on worker processes, with
+    # embedding and upsert batches pipelined on their own pools, so the
+    # pipeline runs as is on the ingest pool; the event loop is only held
+    # while awaiting it. ``progress`` is called on the loop's thread.
+    loop = asyncio.get_running_loop()
+
+    def report(stage: str, counters: Dict[str, int]) -> None:
+        if progress:
+            loop.call_soon_threadsafe(progress, stage, dict(counters))
+
+    return await loop.run_in_executor(
+        _ingest_executor(), tracing.propagate(process_document), index, document_content, namespace, report
+    )
+
+
+# What one ingest knows about its namespace, plus its counters. Built by
+# _plan_ingest and passed through the pipeline steps below.
+@dataclass
+class _IngestRun:
+    index: Any
+    namespace: str
+    content_hash: str
+    registry: DocumentRegistry
+    state: str
+    progress: Optional[Callable[[str, Dict[str, int]], None]] = None
+    # IDs the namespace held before this ingest; the ones not seen again are
+    # deleted at the end.
+    previous_ids: Optional[Set[str]] = None
+    # IDs of a complete earlier revision, trusted to be in the index already.
+    known_ids: Set[str] = field(default_factory=set)
+    seen_ids: Set[str] = field(default_factory=set)
+    stats: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(
+        ("page_count", "pages", "chars", "chunks", "embedded", "reused", "upserted", "deleted"), 0
+    ))
+    chunk_store: Optional[ChunkStore] = None
+    rerank_store: Optional[RerankStore] = None
+    lexical_index: Optional[LexicalIndex] = None
+    coarse_dimension: int = 0
+    # Stage threads report timings through this; see _ingest_document.
+    record_stage: Callable[..., None] = tracing.record
+
+    @property
+    def repair(self) -> bool:
+        # An interrupted ingest: only chunks missing from the index are
+        # embedded and upserted again.
+        return self.state == STATE_PARTIAL
+
+    @property
+    def revision(self) -> str:
+        return self.content_hash[:12]
+
+    def report(self, stage: str) -> None:
+        if self.progress:
+            self.progress(stage, dict(self.stats))
+
+    def set_page_count(self, count: int) -> None:
+        self.stats["page_count"] = count
+
+
+def _plan_ingest(
+    index: Any, namespace: str, content_hash: str, progress: Optional[Callable[[str, Dict[str, int]], None]]
+) -> _IngestRun:
+    # The namespace is either the md5 of the file or a stable logical document
+    # ID. A complete namespace holding these exact contents needs nothing
+    # recomputed; a complete one holding an earlier revision is diffed, so
+    # only new chunks are embedded and chunks that disappeared are deleted.
+    registry = _get_registry()
+    run = _IngestRun(index, namespace, content_hash, registry, registry.state(index, namespace, content_hash), progress)
+    if run.state == STATE_COMPLETE:
+        return run
+    previous_ids = registry.vector_ids(namespace)
+    if run.state == STATE_PARTIAL:
+        # An interrupted revision may have written vectors this node never
+        # recorded; diffing against the index as well removes them too.
+        previous_ids = (previous_ids or set()) | (_list_vector_ids(index, namespace) or set())
+    elif previous_ids is None and run.state != STATE_MISSING:
+        previous_ids = _list_vector_ids(index, namespace)
+    run.previous_ids = previous_ids
+    if run.state == STATE_REVISED and previous_ids:
+        run.known_ids = previous_ids
+    run.chunk_store = _get_chunk_store()
+    run.rerank_store = _get_rerank_store()
+    run.lexical_index = _get_lexical_index()
+    run.coarse_dimension = _coarse_dimension()
+    return run
+
+
+def _extract_stage(
+    run: _IngestRun, document_content: bytes, pages: Optional[Sequence[Tuple[int, str]]]
+) -> Iterator[Tuple[int, str]]:
+    elapsed = 0.0
+    if pages is None:
+        source = iter_pdf_pages(document_content, on_page_count=run.set_page_count)
+    else:
+        run.set_page_count(len(pages))
+        source = iter(pages)
+    while True:
+        start = time.perf_counter()
+        page = next(source, None)
+        elapsed += time.perf_counter() - start
+        if page is None:
+            break
+        yield page
+    run.record_stage("ingest.extract", elapsed, items=run.stats["page_count"])
+
+
+def _chunk_stage(run: _IngestRun, pages: Iterator[Tuple[int, str]]) -> Iterator[List[_Chunk]]:
+    # Yields batches of chunks that need embedding. Chunking time excludes
+    # waiting for pages and for downstream stages.
+    stats = run.stats
+    max_items, max_chars = batch_limits()
+    waited = 0.0
+
+    def counted(pages: Iterator[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        nonlocal waited
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            waited += time.perf_counter() - start
+            if page is None:
+                return
+            stats["pages"] += 1
+            stats["chars"] += len(page[1])
+            run.report("extracting")
+            yield page
+
+    def timed_chunks() -> Iterator[Tuple[str, int, int, int, int]]:
+        elapsed = 0.0
+        chunks = _iter_chunks(counted(pages), max_chunk_size=1500)
+        while True:
+            start = time.perf_counter()
+            item = next(chunks, None)
+            elapsed += time.perf_counter() - start
+            if item is None:
+                break
+            yield item
+        run.record_stage("ingest.chunk", max(0.0, elapsed - waited), items=stats["chunks"], bytes=stats["chars"])
+
+    batch: List[_Chunk] = []
+    batch_chars = 0
+    for chunk, char_start, char_end, first_page, last_page in timed_chunks():
+        vector_id = _vector_id(chunk)
+        # Repeated text within a document maps to one vector.
+        if vector_id in run.seen_ids:
+            continue
+        run.seen_ids.add(vector_id)
+        position = stats["chunks"]
+        stats["chunks"] += 1
+        if vector_id in run.known_ids:
+            stats["reused"] += 1
+            continue
+        if batch and (len(batch) >= max_items or batch_chars + len(chunk) > max_chars):
+            yield batch
+            batch, batch_chars = [], 0
+        batch.append(_Chunk(position, vector_id, chunk, char_start, char_end, first_page, last_page))
+        batch_chars += len(chunk)
+    if batch:
+        yield batch
+
+
+def _embed_batch(run: _IngestRun, batch: List[_Chunk]) -> List[Dict[str, Any]]:
+    # Slots are shared with every other ingest in the process; the span
+    # times the work, not the wait for a slot.
+    with embed_slots(), tracing.span("ingest.embed_batch", items=len(batch),
+                                     bytes=sum(len(chunk.text) for chunk in batch)):
+        return _embed_chunks(run, batch)
+
+
+def _embed_chunks(run: _IngestRun, batch: List[_Chunk]) -> List[Dict[str, Any]]:
+    namespace = run.namespace
+    run.registry.add_vector_ids(namespace, [chunk.vector_id for chunk in batch])
+    if run.lexical_index:
+        run.lexical_index.add_many(namespace, [
+            (chunk.vector_id, chunk.text, {"chunk_index": chunk.position, "char_start": chunk.char_start,
+                                           "char_end": chunk.char_end, "page_start": chunk.page_start,
+                                           "page_end": chunk.page_end})
+            for chunk in batch
+        ])
+    if run.repair:
+        existing = _fetch_existing_ids(run.index, namespace, [chunk.vector_id for chunk in batch])
+        batch = [chunk for chunk in batch if chunk.vector_id not in existing]
+        if not batch:
+            return []
+    embeddings = _embed_texts([chunk.text for chunk in batch], "RETRIEVAL_DOCUMENT", title="Document Chunks")
+    # Texts are stored before their vectors are upserted, so a vector is
+    # never searchable without its text.
+    if run.chunk_store:
+        run.chunk_store.put_many(namespace, {chunk.vector_id: chunk.text for chunk in batch})
+    if run.rerank_store:
+        full = _normalize_rows(embeddings)
+        run.rerank_store.put_many(namespace, {chunk.vector_id: row for chunk, row in zip(batch, full)})
+        embeddings = full[:, :run.coarse_dimension]
+    return _build_vectors(namespace, run.revision, batch, embeddings, include_text=run.chunk_store is None)
+
+
+def _embed_stage(
+    run: _IngestRun, batches: Iterator[List[_Chunk]], embed_batch: Callable[[List[_Chunk]], List[Dict[str, Any]]],
+) -> Iterator[List[Dict[str, Any]]]:
+    for vectors in map_ordered(embed_batch, batches, max(1, env_int("EMBED_MAX_WORKERS", 4))):
+        run.stats["embedded"] += len(vectors)
+        run.report("embedding")
+        yield vectors
+
+
+def _upsert_batch(run: _IngestRun, vectors: List[Dict[str, Any]]) -> int:
+    # Failed batches are retried, and anything still failing leaves the
+    # registry entry in progress so the next upload repairs it.
+    with upsert_slots(), tracing.span("ingest.upsert_batch", items=len(vectors),
+                                      bytes=sum(vector_payload_size(v) for v in vectors)):
+        outcome = upsert_with_retry(run.index, vectors, run.namespace)
+    if outcome.failures:
+        raise RuntimeError(
+            f"{len(outcome.failures)} upsert batch(es) failed "
+            f"({len(outcome.failed_vectors)} vectors): {outcome.failures[0].error}"
+        )
+    return outcome.upserted
+
+
+def _upsert_stage(
+    batches: Iterator[List[Dict[str, Any]]], upsert_batch: Callable[[List[Dict[str, Any]]], int]
+) -> Iterator[int]:
+    # Batches whose chunks were all found in the index arrive empty.
+    return map_ordered(upsert_batch, (batch for batch in batches if batch), max(1, env_int("UPSERT_MAX_WORKERS", 4)))
+
+
+def _record_upserted(run: _IngestRun, upserted: int) -> None:
+    run.stats["upserted"] += upserted
+    run.report("upserting")
+
+
+def _finish_ingest(run: _IngestRun) -> None:
+    # Deletes what the previous revision held and this one does not, then
+    # records the namespace as complete.
+    namespace, stats = run.namespace, run.stats
+    if not stats["chars"]:
+        run.registry.forget(namespace)
+        raise ValueError("No extractable text found in the PDF")
+    if not stats["chunks"]:
+        run.registry.forget(namespace)
+        raise ValueError("Failed to create any text chunks from the document")
+    if run.previous_ids:
+        stale = sorted(run.previous_ids - run.seen_ids)
+        if stale:
+            _delete_vectors(run.index, namespace, stale)
+            for store in (run.chunk_store, run.rerank_store, run.lexical_index):
+                if store:
+                    store.delete(namespace, stale)
+            stats["deleted"] = len(stale)
+    run.registry.set_vector_ids(namespace, run.seen_ids)
+    run.registry.mark_complete(namespace, len(run.seen_ids), run.content_hash)
+    # Answers cached for this namespace may predate the vectors just written.
+    answer_cache = _get_answer_cache()
+    if answer_cache:
+        answer_cache.invalidate(namespace)
+
+
+@contextlib.contextmanager
+def _exclusive_ingest(namespace: str, content_hash: str) -> Iterator[None]:
+    # Two revisions ingesting one namespace at once would both diff against
+    # the same earlier IDs and delete vectors the other one reuses. The same
+    # contents wait for the running ingest (and then find it complete);
+    # different contents are refused, as IngestJobManager does for uploads.
+    with _ingesting_changed:
+        while namespace in _ingesting:
+            if _ingesting[namespace] != content_hash:
+                raise ValueError("Another version of this document is still being processed. Try again shortly.")
+            _ingesting_changed.wait()
+        _ingesting[namespace] = content_hash
+    try:
+        yield
+    finally:
+        with _ingesting_changed:
+            del _ingesting[namespace]
+            _ingesting_changed.notify_all()
+
+
+def _ingest_document(
+    index: Any,
+    document_content: bytes,
+    namespace: str,
+    progress: Optional[Callable[[str, Dict[str, int]], None]],
+    pages: Optional[Sequence[Tuple[int, str]]] = None,
+) -> Dict[str, int]:
+    # Returns the ingest counters.
     if not index:
         raise ValueError("Index cannot be None")
-    if not question or not question.strip():
-        return "Please enter a valid question."
+    if not document_content:
+        raise ValueError("Document content cannot be empty")
     if not namespace or not namespace.strip():
-        return "No active document. Please upload and process a document first."
+        raise ValueError("Namespace cannot be empty")
 
-    genai.configure(api_key=_require_env("GOOGLE_API_KEY"))
+    # Only PDF is supported in this minimal setup
+    if not document_content.startswith(b"%PDF"):
+        raise ValueError("Unsupported file type. Only PDF is supported in this setup.")
 
-    embedding_model, embedding_dimension = _embedding_config()
-    search_embedding = genai.embed_content(
-        model=embedding_model,
-        content=question,
-        task_type="RETRIEVAL_QUERY",
-        output_dimensionality=embedding_dimension
-    )["embedding"]
-    search_embedding = _normalize_vector(search_embedding)
-    matches = index.query(
-        namespace=namespace,
-        vector=search_embedding,
-        top_k=8,
-        include_metadata=True
-    ).get("matches", [])
-
-    if not matches:
-        return "I couldn't find relevant information in the processed document."
-
-    context_parts = [m["metadata"].get("text", "") for m in matches]
-    context = "\n\n---\n\n".join(context_parts)
-
-    prompt = (
+    content_hash = hashlib.md5(document_content).hexdigest()
+    with _exclusive_ingest(namespace, content_hash):
+        return _run_ingest(_plan_ingest(index, namespace, content_hash, progress), document_content, pages)
+
+
+def _run_ingest(
+    run: _IngestRun, document_content: bytes, pages: Optional[Sequence[Tuple[int, str]]]
+) -> Dict[str, int]:
+    if run.state == STATE_COMPLETE:
+        run.report("done")
+        return run.stats
+
+    # Configure Generative AI
+    configure_genai(_require_env("GOOGLE_API_KEY"))
+
+    # Pages stream into the chunker, chunk batches into embedding and embedded
+    # batches into upserts; each stage runs on its own thread with bounded
+    # buffering between them (INGEST_MAX_BUFFER_MB). Stage and pool threads
+    # report their timings in this context, under the ``ingest`` span.
+    run.record_stage = tracing.propagate(tracing.record)
+    embed_batch = tracing.propagate(functools.partial(_embed_batch, run))
+    upsert_batch = tracing.propagate(functools.partial(_upsert_batch, run))
+
+    run.registry.mark_in_progress(run.namespace)
+    run_pipeline(
+        _extract_stage(run, document_content, pages),
+        lambda page: len(page[1]),
+        [
+            ("chunk", functools.partial(_chunk_stage, run), lambda batch: sum(len(chunk.text) for chunk in batch)),
+            ("embed", lambda batches: _embed_stage(run, batches, embed_batch), _vectors_size),
+            ("upsert", lambda batches: _upsert_stage(batches, upsert_batch), lambda _: 0),
+        ],
+        functools.partial(_record_upserted, run),
+    )
+    _finish_ingest(run)
+    run.report("done")
+    return run.stats
+
+
+def _query_executor() -> ThreadPoolExecutor:
+    global _query_pool
+    with _state_lock:
+        if _query_pool is None:
+            _query_pool = ThreadPoolExecutor(
+                max_workers=max(1, env_int("QUERY_MAX_WORKERS", 8)),
+                thread_name_prefix="query",
+            )
+        return _query_pool
+
+
+def _namespace_list(namespaces: Namespaces) -> List[str]:
+    items = [namespaces] if isinstance(namespaces, str) else list(namespaces or [])
+    return list(dict.fromkeys(n.strip() for n in items if n and n.strip()))
+
+
+def _cache_key(namespaces: List[str]) -> str:
+    # Answers over several documents are cached under the sorted, comma-joined
+    # namespaces; AnswerCache.invalidate drops them when any one is re-ingested.
+    return ",".join(sorted(namespaces))
+
+
+def _match_texts(matches: List[Dict[str, Any]]) -> List[str]:
+    # Texts come from the match metadata when ingested there, otherwise from
+    # the local chunk store in one bulk read per namespace.
+    texts = [m["metadata"].get("text") for m in matches]
+    chunk_store = _get_chunk_store()
+    if chunk_store:
+        missing: Dict[str, List[str]] = {}
+        for match, text in zip(matches, texts):
+            if text is None:
+                missing.setdefault(match["namespace"], []).append(match["id"])
+        stored = {ns: chunk_store.get_many(ns, ids) for ns, ids in missing.items()}
+        texts = [
+            text if text is not None else stored.get(m["namespace"], {}).get(m["id"])
+            for m, text in zip(matches, texts)
+        ]
+    return [text or "" for text in texts]
+
+
+def _rerank(namespace: str, query: np.ndarray, matches: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    # Re-scores coarse candidates with their full-dimension vectors from the
+    # local side store; candidates missing there keep their coarse score.
+    rerank_store = _get_rerank_store()
+    stored = rerank_store.get_many(namespace, [m["id"] for m in matches]) if rerank_store else {}
+    for match in matches:
+        vector = stored.get(match["id"])
+        if vector is not None and vector.shape == query.shape:
+            match["score"] = float(vector @ query)
+    matches.sort(key=lambda m: -m["score"])
+    return matches[:top_k]
+
+
+def _query_request(namespace: str, search_embedding: np.ndarray, top_k: int) -> Dict[str, Any]:
+    coarse_dimension = _coarse_dimension()
+    query_vector = search_embedding
+    candidates = top_k
+    if coarse_dimension:
+        query_vector = _normalize_vector(search_embedding[:coarse_dimension])
+        candidates = max(top_k, env_int("RETRIEVAL_CANDIDATES", top_k * 5))
+    return {"namespace": namespace, "vector": query_vector.tolist(), "top_k": candidates, "include_metadata": True}
+
+
+def _query_matches(
+    namespace: str, response: Any, search_embedding: np.ndarray, top_k: int
+) -> List[Dict[str, Any]]:
+    matches = [
+        {"id": m["id"], "score": float(m.get("score") or 0.0), "metadata": m.get("metadata") or {}, "namespace": namespace}
+        for m in response.get("matches", [])
+    ]
+    if _coarse_dimension():
+        with tracing.span("answer.rerank", namespace=namespace, items=len(matches)):
+            matches = _rerank(namespace, search_embedding, matches, top_k)
+    return matches
+
+
+def _query_namespace(index: Any, namespace: str, search_embedding: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+    request = _query_request(namespace, search_embedding, top_k)
+    with tracing.span("answer.query_namespace", namespace=namespace, dimension=len(request["vector"])) as span:
+        response = index.query(**request)
+        span.set(items=len(response.get("matches", [])))
+    return _query_matches(namespace, response, search_embedding, top_k)
+
+
+def _async_query_index(index: Any) -> Any:
+    # A sync Pinecone index is swapped for the async client of the same host;
+    # async indexes and the local index are used as they are.
+    if inspect.iscoroutinefunction(getattr(index, "query", None)):
+        return index
+    return async_vector_index(index) or index
+
+
+async def _query_namespace_async(
+    index: Any, namespace: str, search_embedding: np.ndarray, top_k: int
+) -> List[Dict[str, Any]]:
+    # ``index`` comes from _async_query_index: native async indexes are
+    # awaited directly; other clients run on a worker thread.
+    request = _query_request(namespace, search_embedding, top_k)
+    with tracing.span("answer.query_namespace", namespace=namespace, dimension=len(request["vector"])) as span:
+        if inspect.iscoroutinefunction(getattr(index, "query", None)):
+            response = await index.query(**request)
+        else:
+            response = await asyncio.to_thread(index.query, **request)
+        span.set(items=len(response.get("matches", [])))
+    if _coarse_dimension():
+        return await asyncio.to_thread(_query_matches, namespace, response, search_embedding, top_k)
+    return _query_matches(namespace, response, search_embedding, top_k)
+
+
+def _query_namespaces(
+    index: Any, namespaces: List[str], search_embedding: np.ndarray, top_k: int
+) -> List[Dict[str, Any]]:
+    # One query per namespace with the shared embedding, on a bounded pool so
+    # latency tracks the slowest namespace rather than the sum; the global
+    # top-k is merged with a heap.
+    if len(namespaces) == 1:
+        return _query_namespace(index, namespaces[0], search_embedding, top_k)
+    query = tracing.propagate(_query_namespace)
+    futures = [
+        _query_executor().submit(query, index, namespace, search_embedding, top_k)
+        for namespace in namespaces
+    ]
+    return heapq.nlargest(
+        top_k, (match for future in futures for match in future.result()), key=lambda m: m["score"]
+    )
+
+
+async def _query_namespaces_async(
+    index: Any, namespaces: List[str], search_embedding: np.ndarray, top_k: int
+) -> List[Dict[str, Any]]:
+    index = _async_query_index(index)
+    results = await asyncio.gather(*(
+        _query_namespace_async(index, namespace, search_embedding, top_k) for namespace in namespaces
+    ))
+    return heapq.nlargest(top_k, (match for matches in results for match in matches), key=lambda m: m["score"])
+
+
+def _search_lexical(namespaces: List[str], question: str, top_k: int) -> Tuple[List[Dict[str, Any]], bool]:
+    # Returns (matches, confident). With several documents, the confident
+    # ones answer alone; BM25 scores are merged across namespaces as-is.
+    lexical_index = _get_lexical_index()
+    if not lexical_index:
+        return [], False
+    results = {namespace: lexical_index.search(namespace, question, top_k) for namespace in namespaces}
+    confident = [ns for ns, result in results.items() if result.confident]
+    matches = [
+        {**match, "namespace": namespace}
+        for namespace in (confident or namespaces)
+        for match in results[namespace].matches
+    ]
+    return heapq.nlargest(top_k, matches, key=lambda m: m["score"]), bool(confident)
+
+
+def _fuse(dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    # Reciprocal rank fusion. Dense matches below CONTEXT_MIN_SCORE are dropped
+    # first (the best is kept), since fused scores are ranks, not similarities;
+    # ``lexical`` should hold only exact matches for the same reason.
+    min_score = env_float("CONTEXT_MIN_SCORE", 0.5)
+    dense = [m for i, m in enumerate(dense) if i == 0 or m["score"] >= min_score]
+    k = env_int("RRF_K", 60)
+    fused: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for ranking in (dense, lexical):
+        for rank, match in enumerate(ranking):
+            key = (match["namespace"], match["id"])
+            entry = fused.setdefault(key, {"id": match["id"], "namespace": match["namespace"], "score": 0.0, "metadata": {}})
+            entry["score"] += 1.0 / (k + rank + 1)
+            # Lexical metadata carries the text; dense metadata may not.
+            entry["metadata"] = {**match["metadata"], **entry["metadata"]}
+    return sorted(fused.values(), key=lambda m: -m["score"])[:top_k]
+
+
+def _pack_matches(matches: List[Dict[str, Any]], min_score: Optional[float] = None) -> List[Passage]:
+    # Pinecone returns numeric metadata as floats.
+    def offset(value: Any) -> Optional[int]:
+        return int(value) if value is not None else None
+
+    passages = []
+    for match, text in zip(matches, _match_texts(matches)):
+        metadata = match["metadata"]
+        passages.append(Passage(
+            text=text,
+            score=match["score"],
+            char_start=offset(metadata.get("char_start")),
+            char_end=offset(metadata.get("char_end")),
+            source=match["namespace"],
+        ))
+    return pack_context(
+        passages,
+        min_score=env_float("CONTEXT_MIN_SCORE", 0.5) if min_score is None else min_score,
+        max_tokens=env_int("CONTEXT_MAX_TOKENS", 3000),
+    )
+
+
+def _build_prompt(question: str, passages: List[Passage], labels: Optional[Dict[str, str]] = None) -> str:
+    # With several documents each passage is tagged with its source, so the
+    # model can attribute and compare them.
+    if labels is not None:
+        parts = [f"[Source: {labels.get(p.source, p.source)}]\n{p.text}" for p in passages]
+    else:
+        parts = [p.text for p in passages]
+    context = "\n\n---\n\n".join(parts)
+    return (
         "Answer the question using ONLY the provided context. Be precise and concise.\n\n"
         f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
     )
 
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    response = model.generate_content(prompt, generation_config={"temperature": 0.0, "max_output_tokens": 1024})
-    return (getattr(response, "text", "") or "No answer generated.").strip()
 
+# Carried from the local retrieval steps to the remote ones.
+@dataclass
+class _Retrieval:
+    namespaces: List[str]
+    labels: Optional[Dict[str, str]]
+    cache_key: str
+    top_k: int
+    lexical: List[Dict[str, Any]]
+
+
+def prepare_answer(
+    index: Any,
+    question: str,
+    namespaces: Namespaces,
+    labels: Optional[Dict[str, str]] = None,
+    search_embedding: Optional[np.ndarray] = None,
+) -> Tuple[Optional[str], Optional[str], Optional[np.ndarray]]:
+    # Returns (answer, prompt, query_embedding). A non-None answer is final
+    # (validation message, cache hit or no matches); otherwise the prompt
+    # still has to be sent to the model. Batch callers pass the normalized
+    # ``search_embedding`` they already computed.
+    answer, prompt, retrieval = _start_answer(index, question, namespaces, labels)
+    if retrieval is None:
+        return answer, prompt, None
+    if search_embedding is None:
+        with tracing.span("answer.embed_query"):
+            search_embedding = _normalize_vector(_embed_texts([question], "RETRIEVAL_QUERY")[0])
+    cached = _semantic_cache_hit(retrieval, search_embedding)
+    if cached is not None:
+        return cached, None, None
+    with tracing.span("answer.query_index", namespaces=len(retrieval.namespaces)) as span:
+        matches = _query_namespaces(index, retrieval.namespaces, search_embedding, retrieval.top_k)
+        span.set(items=len(matches))
+    return _finish_answer(question, retrieval, matches, search_embedding)
+
+
+async def _prepare_answer_async(
+    index: Any, question: str, namespaces: Namespaces, labels: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[str], Optional[str], Optional[np.ndarray]]:
+    # ``prepare_answer`` with the query embedding and index queries awaited;
+    # local SQLite steps run on worker threads.
+    answer, prompt, retrieval = await asyncio.to_thread(_start_answer, index, question, namespaces, labels)
+    if retrieval is None:
+        return answer, prompt, None
+    with tracing.span("answer.embed_query"):
+        search_embedding = _normalize_vector((await _embed_texts_async([question], "RETRIEVAL_QUERY"))[0])
+    cached = _semantic_cache_hit(retrieval, search_embedding)
+    if cached is not None:
+        return cached, None, None
+    with tracing.span("answer.query_index", namespaces=len(retrieval.namespaces)) as span:
+        matches = await _query_namespaces_async(index, retrieval.namespaces, search_embedding, retrieval.top_k)
+        span.set(items=len(matches))
+    return await asyncio.to_thread(_finish_answer, question, retrieval, matches, search_embedding)
+
+
+def _start_answer(
+    index: Any, question: str, namespaces: Namespaces, labels: Optional[Dict[str, str]]
+) -> Tuple[Optional[str], Optional[str], Optional[_Retrieval]]:
+    # The local steps: validation, the exact answer cache and the lexical
+    # index. Returns (answer, prompt, None) when they settle the question,
+    # else (None, None, retrieval) for the dense retrieval to continue.
+    if not index:
+        raise ValueError("Index cannot be None")
+    if not question or not question.strip():
+        return "Please enter a valid question.", None, None
+    selected = _namespace_list(namespaces)
+    if not selected:
+        return "No active document. Please upload and process a document first.", None, None
+    cache_key = _cache_key(selected)
+    if len(selected) > 1 and labels is None:
+        labels = {}
+
+    answer_cache = _get_answer_cache()
+    if answer_cache:
+        cached = answer_cache.get(cache_key, question)
+        tracing.count("answer_cache_hit" if cached is not None else "answer_cache_miss")
+        if cached is not None:
+            return cached, None, None
+
+    configure_genai(_require_env("GOOGLE_API_KEY"))
+
+    # The local lexical index runs first; when the question quotes a phrase,
+    # names identifiers or pastes text found verbatim, its matches are used
+    # directly and the query embedding round-trip is skipped.
+    top_k = max(1, env_int("RETRIEVAL_TOP_K", 8))
+    with tracing.span("answer.lexical", namespaces=len(selected)) as span:
+        lexical, confident = _search_lexical(selected, question, top_k)
+        span.set(items=len(lexical), confident=confident)
+    tracing.count("lexical_fast_path" if confident else "lexical_fallthrough")
+    if confident:
+        with tracing.span("answer.pack_context") as span:
+            # The top match is kept for a pasted passage, which names no
+            # identifiers.
+            exact = [match for match in lexical if match.get("exact")] or lexical[:1]
+            prompt = _build_prompt(question, _pack_matches(exact, float("-inf")), labels)
+            span.set(bytes=len(prompt))
+        return None, prompt, None
+    return None, None, _Retrieval(selected, labels, cache_key, top_k, lexical)
+
+
+def _semantic_cache_hit(retrieval: _Retrieval, search_embedding: np.ndarray) -> Optional[str]:
+    answer_cache = _get_answer_cache()
+    if not answer_cache:
+        return None
+    cached = answer_cache.get_similar(retrieval.cache_key, search_embedding)
+    tracing.count("answer_cache_semantic_hit" if cached is not None else "answer_cache_semantic_miss")
+    return cached
+
+
+def _finish_answer(
+    question: str, retrieval: _Retrieval, matches: List[Dict[str, Any]], search_embedding: np.ndarray
+) -> Tuple[Optional[str], Optional[str], Optional[np.ndarray]]:
+    with tracing.span("answer.pack_context") as span:
+        # BM25 shares words with almost any question, so only lexical matches
+        # holding a quoted phrase or a named identifier join the dense ones.
+        exact = [match for match in retrieval.lexical if match.get("exact")]
+        if exact:
+            passages = _pack_matches(_fuse(matches, exact, retrieval.top_k), float("-inf"))
+        elif matches:
+            passages = _pack_matches(matches)
+        else:
+            return "I couldn't find relevant information in the processed document.", None, None
+        prompt = _build_prompt(question, passages, retrieval.labels)
+        span.set(items=len(passages), bytes=len(prompt))
+    return None, prompt, search_embedding
+
+
+def _response_text(response_chunk: Any) -> str:
+    # ``.text`` raises when a streamed chunk carries no text parts (e.g. the
+    # final chunk with only a finish reason).
+    try:
+        return getattr(response_chunk, "text", "") or ""
+    except ValueError:
+        return ""
+
+
+def _remember_answer(namespaces: Namespaces, question: str, answer: str, search_embedding: Optional[np.ndarray]) -> None:
+    answer_cache = _get_answer_cache()
+    if answer_cache:
+        answer_cache.put(_cache_key(_namespace_list(namespaces)), question, answer, search_embedding)
+
+
+def generate_answer(
+    prompt: str, namespace: Namespaces, question: str, search_embedding: Optional[np.ndarray]
+) -> str:
+    # Non-streaming generation for a prompt from ``prepare_answer``; a
+    # non-empty answer is added to the answer cache. Returns "" when the model
+    # produced no text.
+    with tracing.span("answer.generate", prompt_bytes=len(prompt)) as span:
+        response = generative_model(ANSWER_MODEL).generate_content(prompt, generation_config=GENERATION_CONFIG)
+        answer = _response_text(response).strip()
+        span.set(bytes=len(answer))
+    if answer:
+        _remember_answer(namespace, question, answer, search_embedding)
+    return answer
+
+
+def _answer_piece(text: str, parts: List[str]) -> str:
+    # The first yielded text drops leading whitespace, matching the stripped
+    # non-streaming answer.
+    if not parts:
+        text = text.lstrip()
+    if text:
+        parts.append(text)
+    return text
+
+
+def _record_generation(seconds: float, prompt: Optional[str], parts: List[str], first_token: Optional[float]) -> None:
+    tracing.record(
+        "answer.generate",
+        seconds,
+        prompt_bytes=len(prompt or ""),
+        bytes=sum(len(part) for part in parts),
+        time_to_first_token_ms=round((first_token or 0.0) * 1000, 1),
+    )
+
+
+def stream_answer(
+    index: Any, question: str, namespace: Namespaces, labels: Optional[Dict[str, str]] = None
+) -> Iterator[str]:
+    # ``namespace`` may be one namespace or several; ``labels`` maps
+    # namespaces to the document names shown in source tags.
+    with tracing.span("answer.prepare"):
+        answer, prompt, search_embedding = prepare_answer(index, question, namespace, labels)
+    if answer is not None:
+        yield answer
+        return
+
+    # Generation spans yields, so it is timed by hand rather than in a span
+    # context; ``time_to_first_token_ms`` excludes time spent by the consumer.
+    parts: List[str] = []
+    generating = 0.0
+    first_token: Optional[float] = None
+    try:
+        start = time.perf_counter()
+        response = generative_model(ANSWER_MODEL).generate_content(
+            prompt, generation_config=GENERATION_CONFIG, stream=True
+        )
+        for response_chunk in response:
+            generating += time.perf_counter() - start
+            piece = _answer_piece(_response_text(response_chunk), parts)
+            if piece:
+                if first_token is None:
+                    first_token = generating
+                yield piece
+            start = time.perf_counter()
+        generating += time.perf_counter() - start
+    finally:
+        _record_generation(generating, prompt, parts, first_token)
+
+    answer = "".join(parts).strip()
+    if not answer:
+        yield "No answer generated."
+        return
+    _remember_answer(namespace, question, answer, search_embedding)
+
+
+async def stream_answer_async(
+    index: Any, question: str, namespace: Namespaces, labels: Optional[Dict[str, str]] = None
+) -> AsyncIterator[str]:
+    # ``stream_answer`` on the async Gemini client and, when ``index`` has an
+    # async ``query``, the async index client, so an in-flight question holds
+    # no thread while it waits on the network.
+    with tracing.span("answer.prepare"):
+        answer, prompt, search_embedding = await _prepare_answer_async(index, question, namespace, labels)
+    if answer is not None:
+        yield answer
+        return
+
+    parts: List[str] = []
+    generating = 0.0
+    first_token: Optional[float] = None
+    try:
+        start = time.perf_counter()
+        response = await generative_model(ANSWER_MODEL).generate_content_async(
+            prompt, generation_config=GENERATION_CONFIG, stream=True
+        )
+        async for response_chunk in response:
+            generating += time.perf_counter() - start
+            piece = _answer_piece(_response_text(response_chunk), parts)
+            if piece:
+                if first_token is None:
+                    first_token = generating
+                yield piece
+            start = time.perf_counter()
+        generating += time.perf_counter() - start
+    finally:
+        _record_generation(generating, prompt, parts, first_token)
+
+    answer = "".join(parts).strip()
+    if not answer:
+        yield "No answer generated."
+        return
+    _remember_answer(namespace, question, answer, search_embedding)
+
+
+def get_answer(index: Any, question: str, namespace: Namespaces, labels: Optional[Dict[str, str]] = None) -> str:
+    return "".join(stream_answer(index, question, namespace, labels)).strip()
 
 
+async def get_answer_async(
+    index: Any, question: str, namespace: Namespaces, labels: Optional[Dict[str, str]] = None
+) -> str:
+    return "".join([piece async for piece in stream_answer_async(index, question, namespace, labels)]).strip()
@@ -0,0 +1,78 @@
+import os
+import threading
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from settings import data_dir
+from sqlite_util import chunked, connect
+
+DTYPES = ("float16", "int8")
+
+
+def _encode(vector: np.ndarray, dtype: str) -> tuple[bytes, float]:
+    if dtype == "int8":
+        # Symmetric per-vector scale; unit vectors keep roughly two decimal
+        # digits per component, plenty for reranking a short candidate list.
+        scale = float(np.max(np.abs(vector))) / 127.0 or 1.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), scale
+    return vector.astype(np.float16).tobytes(), 1.0
+
+
+def _decode(blob: bytes, dtype: str, scale: float) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.dtype(dtype)).astype(np.float32) * np.float32(scale)
+
+
+# Local side store of full-dimension embeddings for two-stage retrieval: the
+# vector index holds a truncated (Matryoshka) projection for candidate search
+# and the candidates are re-scored here at full dimension. Vectors are kept
+# as float16, or int8 with a per-vector scale, keyed by namespace and ID.
+class RerankStore:
+    def __init__(self, path: Optional[str] = None, dtype: Optional[str] = None):
+        self.path = path or os.path.join(data_dir(), "rerank.sqlite3")
+        self.dtype = (dtype or os.getenv("RERANK_STORE_DTYPE", "float16") or "float16").strip().lower()
+        if self.dtype not in DTYPES:
+            raise ValueError(f"RERANK_STORE_DTYPE must be one of {', '.join(DTYPES)}")
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "namespace TEXT NOT NULL, id TEXT NOT NULL, vector BLOB NOT NULL, dtype TEXT NOT NULL, "
+            "scale REAL NOT NULL, PRIMARY KEY (namespace, id))"
+        )
+        self._conn.commit()
+
+    def put_many(self, namespace: str, items: Dict[str, np.ndarray]) -> None:
+        rows = []
+        for vector_id, vector in items.items():
+            blob, scale = _encode(np.asarray(vector, dtype=np.float32), self.dtype)
+            rows.append((namespace, vector_id, blob, self.dtype, scale))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (namespace, id, vector, dtype, scale) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get_many(self, namespace: str, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        unique = list(dict.fromkeys(ids))
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for batch, placeholders in chunked(unique):
+                for vector_id, blob, dtype, scale in self._conn.execute(
+                    f"SELECT id, vector, dtype, scale FROM vectors WHERE namespace = ? AND id IN ({placeholders})",
+                    [namespace, *batch],
+                ):
+                    found[vector_id] = _decode(blob, dtype, scale)
+        return found
+
+    def delete(self, namespace: str, ids: Optional[Sequence[str]] = None) -> None:
+        with self._lock:
+            if ids is None:
+                self._conn.execute("DELETE FROM vectors WHERE namespace = ?", (namespace,))
+            else:
+                self._conn.executemany(
+                    "DELETE FROM vectors WHERE namespace = ? AND id = ?", [(namespace, vector_id) for vector_id in ids]
+                )
+            self._conn.commit()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from pinecone import Pinecone
+
+from local_index import open_local_index
+from settings import env_int
+
+# Process-wide registry of warm clients. Streamlit re-executes app.py on every
+# interaction but imports this module once per process, so clients built here
+# are shared by every session and rerun; each one is rebuilt only when the
+# configuration it was built from changes.
+
+_lock = threading.RLock()
+_resources: Dict[str, Tuple[Hashable, Any]] = {}
+_env_loaded = False
+# Async index clients per event loop; see async_vector_index.
+_async_indexes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_resource(name: str, config_key: Hashable, factory: Callable[[], Any]) -> Any:
+    with _lock:
+        entry = _resources.get(name)
+        if entry is not None and entry[0] == config_key:
+            return entry[1]
+        value = factory()
+        _resources[name] = (config_key, value)
+        return value
+
+
+def clear_resources() -> None:
+    with _lock:
+        _resources.clear()
+
+
+def load_environment() -> None:
+    global _env_loaded
+    with _lock:
+        if not _env_loaded:
+            load_dotenv()
+            _env_loaded = True
+
+
+def configure_genai(api_key: str) -> None:
+    get_resource("genai", api_key, lambda: genai.configure(api_key=api_key))
+
+
+def generative_model(model_name: str) -> Any:
+    # Keyed on the API key as well, so a rotated key gets a fresh client.
+    api_key = os.getenv("GOOGLE_API_KEY", "")
+    return get_resource(f"model:{model_name}", api_key, lambda: genai.GenerativeModel(model_name))
+
+
+def vector_index() -> Any:
+    # VECTOR_BACKEND=local swaps Pinecone for the embedded on-disk index, for
+    # air-gapped or single-node installs.
+    backend = (os.getenv("VECTOR_BACKEND", "pinecone") or "pinecone").strip().lower()
+    if backend == "local":
+        return open_local_index()
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    index_name = os.getenv("PINECONE_INDEX")
+    if not api_key or not index_name:
+        raise ValueError("PINECONE_API_KEY and PINECONE_INDEX must be set in environment.")
+    # Sized to cover the concurrent upsert and query workers; 0 keeps the
+    # client's default.
+    pool_size = max(0, env_int("PINECONE_POOL_MAXSIZE", 0))
+
+    def build() -> Any:
+        return Pinecone(api_key=api_key, connection_pool_maxsize=pool_size).Index(index_name)
+
+    return get_resource("pinecone_index", (api_key, index_name, pool_size), build)
+
+
+def async_vector_index(index: Any) -> Optional[Any]:
+    # Pinecone's async data-plane client for the same host as ``index`` (a
+    # sync Pinecone Index), so questions asked from an event loop await their
+    # queries instead of holding an executor thread. Its connection pool
+    # belongs to the loop that uses it, so each running loop gets its own
+    # client. None for indexes without a Pinecone host, e.g. the local one.
+    host = getattr(index, "host", None)
+    if not isinstance(host, str) or not host:
+        return None
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        return None
+    pool_size = max(0, env_int("PINECONE_POOL_MAXSIZE", 0))
+    loop = asyncio.get_running_loop()
+    key = (api_key, host, pool_size)
+    with _lock:
+        clients = _async_indexes.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = Pinecone(api_key=api_key, connection_pool_maxsize=pool_size).IndexAsyncio(host=host)
+        return clients[key]
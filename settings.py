@@ -0,0 +1,32 @@
+import os
+
+
+def env_int(var_name: str, default: int) -> int:
+    raw = (os.getenv(var_name, str(default)) or str(default)).strip()
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def env_float(var_name: str, default: float) -> float:
+    raw = (os.getenv(var_name, str(default)) or str(default)).strip()
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
+def env_flag(var_name: str, default: bool = False) -> bool:
+    raw = os.getenv(var_name)
+    if raw is None or not raw.strip():
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def data_dir() -> str:
+    # Local state (registries, caches, side stores) lives under one directory
+    # so a deployment can mount or wipe it as a unit.
+    path = os.getenv("INSIGHTENGINE_DATA_DIR", ".insightengine").strip() or ".insightengine"
+    os.makedirs(path, exist_ok=True)
+    return path
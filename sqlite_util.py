@@ -0,0 +1,25 @@
+import sqlite3
+from typing import Iterator, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Kept well below SQLite's bound-parameter limit (999 on older builds), so IN
+# lists are split into batches of this size.
+MAX_VARIABLES = 500
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # One WAL connection per store, shared by its threads; each store serializes
+    # access with its own lock. synchronous=NORMAL is safe under WAL and skips
+    # an fsync per commit.
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def chunked(values: Sequence[T], size: int = MAX_VARIABLES) -> Iterator[Tuple[List[T], str]]:
+    # Yields (batch, placeholders) for ``... IN ({placeholders})`` queries.
+    for i in range(0, len(values), size):
+        batch = list(values[i:i + size])
+        yield batch, ",".join("?" * len(batch))
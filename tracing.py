@@ -0,0 +1,259 @@
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from settings import env_flag, env_int
+
+# Lightweight spans around pipeline stages. Every finished span goes to the
+# registered hooks: the built-in Prometheus-style metrics, OpenTelemetry when
+# installed and enabled, and any collector active in the current context
+# (used for the per-request timing breakdown in the chat UI).
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    parent: Optional["Span"] = None
+    duration: Optional[float] = None
+    # Hook-private state, e.g. the matching OpenTelemetry span.
+    handles: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def depth(self) -> int:
+        return 0 if self.parent is None else self.parent.depth + 1
+
+
+class Hook(Protocol):
+    def on_start(self, span: Span) -> None: ...
+
+    def on_end(self, span: Span) -> None: ...
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("insightengine_span", default=None)
+_collector: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar("insightengine_trace", default=None)
+_hooks: List[Hook] = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Hook) -> None:
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _finish(span: Span) -> None:
+    for hook in list(_hooks):
+        hook.on_end(span)
+    collected = _collector.get()
+    if collected is not None:
+        collected.append(span)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    current = Span(name=name, start=time.perf_counter(), attributes=attributes, parent=_current.get())
+    for hook in list(_hooks):
+        hook.on_start(current)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.set(error=type(exc).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        current.duration = time.perf_counter() - current.start
+        _finish(current)
+
+
+def record(name: str, duration: float, **attributes: Any) -> None:
+    # A span measured by the caller, for work that cannot sit inside a
+    # ``with`` block (generators, time accumulated across a loop).
+    finished = Span(name=name, start=time.perf_counter() - duration, attributes=attributes,
+                    parent=_current.get(), duration=duration)
+    for hook in list(_hooks):
+        hook.on_start(finished)
+    _finish(finished)
+
+
+def count(event: str, value: float = 1) -> None:
+    if value:
+        _metrics.increment(event, value)
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[List[Span]]:
+    # Collects every span finished in this context (and in worker tasks
+    # started with ``propagate``) into the yielded list.
+    spans: List[Span] = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+    # Binds ``fn`` to the caller's context so spans in pool threads keep
+    # their parent and collector. Each call runs in its own copy, so the
+    # wrapper can be used by concurrent tasks.
+    context = contextvars.copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def breakdown(spans: List[Span]) -> List[Tuple[str, float, Dict[str, Any]]]:
+    # (indented name, milliseconds, attributes) in start order.
+    rows = []
+    for item in sorted(spans, key=lambda s: s.start):
+        rows.append(("  " * item.depth + item.name, (item.duration or 0.0) * 1000, dict(item.attributes)))
+    return rows
+
+
+class MetricsHook:
+    # Per-stage duration histograms plus event counters, rendered in the
+    # Prometheus text exposition format.
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS, prefix: str = "insightengine"):
+        self.buckets = buckets
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, List[float]] = {}
+        self._sums: Dict[str, float] = {}
+        self._counters: Dict[str, float] = {}
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        duration = span.duration or 0.0
+        with self._lock:
+            counts = self._histograms.setdefault(span.name, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, duration)] += 1
+            self._sums[span.name] = self._sums.get(span.name, 0.0) + duration
+        for key in ("items", "bytes"):
+            value = span.attributes.get(key)
+            if isinstance(value, (int, float)):
+                self.increment(f"{span.name}.{key}", value)
+
+    def increment(self, event: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def render(self) -> str:
+        lines = [f"# TYPE {self.prefix}_stage_seconds histogram"]
+        with self._lock:
+            for name in sorted(self._histograms):
+                cumulative = 0
+                for bound, value in zip(list(self.buckets) + ["+Inf"], self._histograms[name]):
+                    cumulative += value
+                    lines.append(f'{self.prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.prefix}_stage_seconds_sum{{stage="{name}"}} {self._sums[name]:.6f}')
+                lines.append(f'{self.prefix}_stage_seconds_count{{stage="{name}"}} {cumulative}')
+            lines.append(f"# TYPE {self.prefix}_events_total counter")
+            for event in sorted(self._counters):
+                lines.append(f'{self.prefix}_events_total{{event="{event}"}} {self._counters[event]:g}')
+        return "\n".join(lines) + "\n"
+
+
+class OpenTelemetryHook:
+    # Mirrors spans into OpenTelemetry, nested under their parents, for
+    # whatever exporter the process has configured.
+    def __init__(self, tracer: Any):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = tracer
+
+    def on_start(self, span: Span) -> None:
+        parent = span.parent.handles.get("otel") if span.parent else None
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        start_ns = time.time_ns() - int((time.perf_counter() - span.start) * 1e9)
+        span.handles["otel"] = self._tracer.start_span(span.name, context=context, start_time=start_ns)
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.handles.get("otel")
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if isinstance(value, (bool, int, float, str)):
+                otel_span.set_attribute(key, value)
+        end_ns = time.time_ns() - int((time.perf_counter() - span.start - (span.duration or 0.0)) * 1e9)
+        otel_span.end(end_time=end_ns)
+
+
+_metrics = MetricsHook()
+add_hook(_metrics)
+_setup_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+_otel_enabled = False
+
+
+def metrics() -> MetricsHook:
+    return _metrics
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def setup() -> None:
+    # Idempotent, called at app start. METRICS_PORT serves /metrics;
+    # TRACING_OTEL=1 exports spans through the OpenTelemetry API if it is
+    # installed (the SDK and exporter are configured by the deployment).
+    global _server, _otel_enabled
+    with _setup_lock:
+        port = env_int("METRICS_PORT", 0)
+        if port and _server is None:
+            try:
+                _server = start_metrics_server(port, os.getenv("METRICS_HOST", "0.0.0.0"))
+            except OSError:
+                # Another process (or Streamlit worker) already serves it.
+                pass
+        if env_flag("TRACING_OTEL", False) and not _otel_enabled:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                return
+            add_hook(OpenTelemetryHook(trace.get_tracer("insightengine")))
+            _otel_enabled = True
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from embedding_scheduler import backoff_delay
+from settings import env_int
+
+# Pinecone rejects upsert requests over 2 MB or 1000 vectors; the byte budget
+# leaves headroom for the request envelope.
+DEFAULT_MAX_BATCH_BYTES = 1_500_000
+DEFAULT_MAX_BATCH_VECTORS = 500
+
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, env_int("UPSERT_MAX_WORKERS", 4)),
+                thread_name_prefix="upsert",
+            )
+        return _executor
+
+
+def upsert_slots() -> threading.BoundedSemaphore:
+    # Shared by every ingest in the process, like the pool above: at most
+    # UPSERT_MAX_WORKERS ingest upserts are in flight across documents.
+    global _slots
+    with _executor_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(max(1, env_int("UPSERT_MAX_WORKERS", 4)))
+        return _slots
+
+
+@dataclass
+class BatchFailure:
+    vectors: List[Dict[str, Any]]
+    error: Exception
+
+
+@dataclass
+class UpsertReport:
+    batches: int = 0
+    upserted: int = 0
+    failures: List[BatchFailure] = field(default_factory=list)
+
+    @property
+    def failed_vectors(self) -> List[Dict[str, Any]]:
+        return [v for failure in self.failures for v in failure.vectors]
+
+
+# Upper bound on one float32 value serialized as JSON, separator included.
+JSON_FLOAT_BYTES = 24
+
+
+def vector_payload_size(vector: Dict[str, Any]) -> int:
+    rest = {key: value for key, value in vector.items() if key != "values"}
+    return len(vector["values"]) * JSON_FLOAT_BYTES + len(
+        json.dumps(rest, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    )
+
+
+def _to_wire(vector: Dict[str, Any]) -> Dict[str, Any]:
+    values = vector["values"]
+    if isinstance(values, np.ndarray):
+        return {**vector, "values": values.tolist()}
+    return vector
+
+
+def pack_batches(vectors: List[Dict[str, Any]], max_bytes: int, max_vectors: int) -> List[List[Dict[str, Any]]]:
+    batches: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    current_bytes = 0
+    for vector in vectors:
+        size = vector_payload_size(vector)
+        if current and (current_bytes + size > max_bytes or len(current) >= max_vectors):
+            batches.append(current)
+            current, current_bytes = [], 0
+        # A single vector larger than the budget still goes out on its own;
+        # the index reports the error for that batch alone.
+        current.append(vector)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _capture(fn: Any, batch: List[Dict[str, Any]]) -> Optional[Exception]:
+    try:
+        fn(batch)
+    except Exception as exc:
+        return exc
+    return None
+
+
+def upsert_vectors(index: Any, vectors: List[Dict[str, Any]], namespace: str) -> UpsertReport:
+    max_bytes = max(1, env_int("UPSERT_MAX_BATCH_BYTES", DEFAULT_MAX_BATCH_BYTES))
+    max_vectors = max(1, env_int("UPSERT_MAX_BATCH_VECTORS", DEFAULT_MAX_BATCH_VECTORS))
+    batches = pack_batches(vectors, max_bytes, max_vectors)
+    report = UpsertReport(batches=len(batches))
+
+    def send(batch: List[Dict[str, Any]]) -> None:
+        index.upsert(vectors=[_to_wire(v) for v in batch], namespace=namespace)
+
+    if len(batches) == 1:
+        outcomes = [(batches[0], _capture(send, batches[0]))]
+    else:
+        futures = [(batch, _get_executor().submit(_capture, send, batch)) for batch in batches]
+        outcomes = [(batch, future.result()) for batch, future in futures]
+    for batch, error in outcomes:
+        if error is None:
+            report.upserted += len(batch)
+        else:
+            report.failures.append(BatchFailure(vectors=batch, error=error))
+    return report
+
+
+def upsert_with_retry(index: Any, vectors: List[Dict[str, Any]], namespace: str) -> UpsertReport:
+    attempts = max(1, env_int("UPSERT_MAX_ATTEMPTS", 3))
+    report = upsert_vectors(index, vectors, namespace)
+    for attempt in range(1, attempts):
+        if not report.failures:
+            break
+        time.sleep(backoff_delay(attempt - 1, 0.5, 10.0))
+        retry = upsert_vectors(index, report.failed_vectors, namespace)
+        report.upserted += retry.upserted
+        report.batches += retry.batches
+        report.failures = retry.failures
+    return report
+